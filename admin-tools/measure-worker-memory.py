@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Report the unique and shared resident memory of worker processes (Linux only).
+
+For each process, it reports (in MB):
+- RSS: the resident memory, counting shared pages fully;
+- unique (USS): the private pages, i.e. the memory that would be freed
+  if the process was killed;
+- shared: the resident pages shared with other processes (e.g. copy-on-write
+  pages inherited from a preloading master process);
+- PSS: the resident memory with shared pages split among the processes
+  sharing them; the sum over all processes is their total memory usage.
+
+Examples:
+
+    # All children of a master process (e.g. of webservice/prefork_server.py)
+    python admin-tools/measure-worker-memory.py --children-of 1234
+    # Given processes (e.g. mod_wsgi daemon processes)
+    python admin-tools/measure-worker-memory.py $(pgrep -f '(wsgi:tools_app)')
+"""
+import argparse
+import os
+
+FIELDS = [
+    "Rss",
+    "Pss",
+    "Shared_Clean",
+    "Shared_Dirty",
+    "Private_Clean",
+    "Private_Dirty",
+]
+
+
+def get_memory_info(pid):
+    """Return a dictionary with the memory fields (in kB) of a process."""
+    info = dict.fromkeys(FIELDS, 0)
+    rollup_path = "/proc/{}/smaps_rollup".format(pid)
+    # smaps_rollup (Linux >= 4.14) has the totals; otherwise sum all mappings
+    path = rollup_path if os.path.exists(rollup_path) else "/proc/{}/smaps".format(pid)
+    with open(path) as fhandle:
+        for line in fhandle:
+            key, _, value = line.partition(":")
+            if key in info:
+                info[key] += int(value.split()[0])
+    return info
+
+
+def get_children(pid):
+    """Return the PIDs of the children of a process."""
+    children = []
+    for task in os.listdir("/proc/{}/task".format(pid)):
+        with open("/proc/{}/task/{}/children".format(pid, task)) as fhandle:
+            children.extend(int(child) for child in fhandle.read().split())
+    return sorted(children)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pids", nargs="*", type=int, help="PIDs of the processes")
+    parser.add_argument(
+        "--children-of",
+        type=int,
+        metavar="PID",
+        help="Also measure all children of this process",
+    )
+    args = parser.parse_args()
+
+    pids = list(args.pids)
+    if args.children_of is not None:
+        pids.extend(get_children(args.children_of))
+    if not pids:
+        parser.error("No processes to measure")
+
+    print(
+        "{:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "PID", "RSS [MB]", "unique", "shared", "PSS"
+        )
+    )
+    totals = dict.fromkeys(["rss", "unique", "shared", "pss"], 0.0)
+    for pid in pids:
+        info = get_memory_info(pid)
+        values = {
+            "rss": info["Rss"] / 1024,
+            "unique": (info["Private_Clean"] + info["Private_Dirty"]) / 1024,
+            "shared": (info["Shared_Clean"] + info["Shared_Dirty"]) / 1024,
+            "pss": info["Pss"] / 1024,
+        }
+        for key, value in values.items():
+            totals[key] += value
+        print(
+            "{:>8} {rss:>10.1f} {unique:>10.1f} {shared:>10.1f} {pss:>10.1f}".format(
+                pid, **values
+            )
+        )
+    print(
+        "{:>8} {rss:>10.1f} {unique:>10.1f} {shared:>10.1f} {pss:>10.1f}".format(
+            "total", **totals
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
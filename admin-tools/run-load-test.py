@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+"""
+Load-test the app in-process, with the structure examples used by the tests.
+
+Structures from tests/structure_converters/structure_examples/valid (and,
+optionally, generated large structures) are uploaded concurrently to
+/compute/process_structure/, either via the Flask test client or via a
+local threaded WSGI server. For each concurrency level, the throughput and
+the p50/p95/p99 latency and error rate per format are reported.
+
+The app must be importable, i.e. the SECRET_KEY and the Materials Cloud
+header files must be in the webservice folder (as in the docker container).
+Example:
+
+    python admin-tools/run-load-test.py --concurrency 1,4,16 --requests 200 \\
+        --mix cif-pymatgen=3,xyz-ase=1 --large-structures 1000,10000
+"""
+import argparse
+import collections
+import concurrent.futures
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+DEFAULT_EXAMPLES_FOLDER = os.path.join(
+    ROOT_FOLDER, "tests", "structure_converters", "structure_examples", "valid"
+)
+DEFAULT_WEBSERVICE_FOLDER = os.path.join(ROOT_FOLDER, "webservice")
+PROCESS_URL = "/compute/process_structure/"
+
+Upload = collections.namedtuple(
+    "Upload", ["label", "fileformat", "filename", "content", "extra_data"]
+)
+
+
+def get_example_uploads(examples_folder):
+    """Return the uploads for all files of the examples folder.
+
+    As in the tests, additional form data for a file XXX can be
+    specified in a JSON file named .extra.XXX in the same folder.
+    """
+    uploads = []
+    for fileformat in sorted(os.listdir(examples_folder)):
+        format_folder = os.path.join(examples_folder, fileformat)
+        if not os.path.isdir(format_folder):
+            continue
+        for filename in sorted(os.listdir(format_folder)):
+            if filename.endswith("~") or filename.startswith("."):
+                continue
+            with open(os.path.join(format_folder, filename), "rb") as fhandle:
+                content = fhandle.read()
+            extra_data = {}
+            extra_file = os.path.join(format_folder, ".extra.{}".format(filename))
+            if os.path.isfile(extra_file):
+                with open(extra_file) as fhandle:
+                    extra_data = json.load(fhandle)
+            uploads.append(
+                Upload(fileformat, fileformat, filename, content, extra_data)
+            )
+    return uploads
+
+
+def get_large_upload(num_atoms):
+    """Return the upload of a generated VASP POSCAR with (at least)
+    `num_atoms` atoms, on a simple cubic grid."""
+    side = 1
+    while side**3 < num_atoms:
+        side += 1
+    lines = [
+        "Generated structure",
+        "1.0",
+        "{} 0 0".format(2.5 * side),
+        "0 {} 0".format(2.5 * side),
+        "0 0 {}".format(2.5 * side),
+        "Si",
+        str(side**3),
+        "Direct",
+    ]
+    lines.extend(
+        "{} {} {}".format(i / side, j / side, k / side)
+        for i in range(side)
+        for j in range(side)
+        for k in range(side)
+    )
+    return Upload(
+        "vasp-ase[{} atoms]".format(side**3),
+        "vasp-ase",
+        "POSCAR-generated",
+        ("\n".join(lines) + "\n").encode("utf-8"),
+        {},
+    )
+
+
+def parse_mix(mix_string):
+    """Parse a string like 'cif-pymatgen=3,xyz-ase=1' into a dictionary
+    of weights per format."""
+    weights = {}
+    for entry in mix_string.split(","):
+        label, _, weight = entry.partition("=")
+        weights[label.strip()] = float(weight or 1)
+    return weights
+
+
+def get_percentile(sorted_values, percentile):
+    """Return a percentile (0-100) of a sorted list, with the nearest-rank method."""
+    if not sorted_values:
+        return float("nan")
+    index = max(0, int(round(percentile / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+class TestClientSender:
+    """Send uploads with the Flask test client (one client per thread)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, upload):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self.app.test_client()
+            self._local.client = client
+        data = dict(upload.extra_data)
+        data["fileformat"] = upload.fileformat
+        data["structurefile"] = (io.BytesIO(upload.content), upload.filename)
+        return client.post(PROCESS_URL, data=data).status_code
+
+    def close(self):
+        pass
+
+
+class WSGIServerSender:
+    """Send uploads over HTTP to a local threaded WSGI server."""
+
+    def __init__(self, app):
+        from werkzeug.serving import (  # pylint: disable=import-outside-toplevel
+            make_server,
+        )
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self._local = threading.local()
+
+    def send(self, upload):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection("127.0.0.1", self.server.port)
+            self._local.connection = connection
+        boundary = uuid.uuid4().hex
+        parts = []
+        fields = dict(upload.extra_data)
+        fields["fileformat"] = upload.fileformat
+        for name, value in fields.items():
+            parts.append(
+                '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(
+                    boundary, name, value
+                ).encode(
+                    "utf-8"
+                )
+            )
+        parts.append(
+            (
+                '--{}\r\nContent-Disposition: form-data; name="structurefile"; '
+                'filename="{}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+            )
+            .format(boundary, upload.filename)
+            .encode("utf-8")
+            + upload.content
+            + b"\r\n"
+        )
+        parts.append("--{}--\r\n".format(boundary).encode("utf-8"))
+        connection.request(
+            "POST",
+            PROCESS_URL,
+            body=b"".join(parts),
+            headers={"Content-Type": "multipart/form-data; boundary=" + boundary},
+        )
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_load(sender, uploads, weights, concurrency, num_requests, seed):
+    """Send `num_requests` uploads, drawn from `uploads` with the given weights,
+    with `concurrency` threads.
+
+    :return: a tuple with the elapsed time and a dictionary with, for each
+        label, a list of (latency, success) tuples
+    """
+    rng = random.Random(seed)
+    # The weight of a format is split among all of its files
+    files_per_label = collections.Counter(upload.label for upload in uploads)
+    upload_weights = [
+        weights.get(upload.label, 0) / files_per_label[upload.label]
+        for upload in uploads
+    ]
+    if sum(upload_weights) <= 0:
+        raise ValueError("The total weight of the uploads must be positive")
+    schedule = rng.choices(uploads, weights=upload_weights, k=num_requests)
+    results = collections.defaultdict(list)
+
+    def send(upload):
+        start = time.perf_counter()
+        try:
+            # Failed parsing redirects to the input page; only a 200 is a success
+            success = sender.send(upload) == 200
+        except Exception:  # pylint: disable=broad-except
+            success = False
+        return upload.label, time.perf_counter() - start, success
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for label, latency, success in executor.map(send, schedule):
+            results[label].append((latency, success))
+    return time.perf_counter() - start, results
+
+
+def get_report(elapsed, results):
+    """Return a dictionary with throughput, latencies and error rates."""
+    total = sum(len(values) for values in results.values())
+    report = {"requests": total, "throughput": total / elapsed, "formats": {}}
+    for label, values in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in values)
+        errors = sum(1 for _, success in values if not success)
+        report["formats"][label] = {
+            "requests": len(values),
+            "error_rate": errors / len(values),
+            "p50_ms": 1000 * get_percentile(latencies, 50),
+            "p95_ms": 1000 * get_percentile(latencies, 95),
+            "p99_ms": 1000 * get_percentile(latencies, 99),
+        }
+    return report
+
+
+def print_report(concurrency, report):
+    """Print a report as a table."""
+    print(
+        "\nConcurrency {}: {} requests, {:.1f} requests/s".format(
+            concurrency, report["requests"], report["throughput"]
+        )
+    )
+    print(
+        "{:<28} {:>8} {:>8} {:>10} {:>10} {:>10}".format(
+            "format", "requests", "errors", "p50 [ms]", "p95 [ms]", "p99 [ms]"
+        )
+    )
+    for label, stats in report["formats"].items():
+        print(
+            "{:<28} {:>8} {:>7.1f}% {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                label,
+                stats["requests"],
+                100 * stats["error_rate"],
+                stats["p50_ms"],
+                stats["p95_ms"],
+                stats["p99_ms"],
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16",
+        help="Comma-separated list of numbers of concurrent clients (default: 1,4,16)",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=100,
+        help="Number of requests for each concurrency level (default: 100)",
+    )
+    parser.add_argument(
+        "--mix",
+        help="Comma-separated weights per format, e.g. 'cif-pymatgen=3,xyz-ase=1' "
+        "(default: all formats with the same weight); the generated large "
+        "structures have weight 1 unless given, e.g. 'vasp-ase[1000 atoms]=0.5'",
+    )
+    parser.add_argument(
+        "--large-structures",
+        default="",
+        help="Comma-separated numbers of atoms of generated VASP structures to add "
+        "to the mix, e.g. '1000,10000'; they are labeled 'vasp-ase[N atoms]'",
+    )
+    parser.add_argument(
+        "--server",
+        choices=["testclient", "wsgi"],
+        default="testclient",
+        help="Use the Flask test client, or a local threaded WSGI server",
+    )
+    parser.add_argument("--examples-folder", default=DEFAULT_EXAMPLES_FOLDER)
+    parser.add_argument("--webservice-folder", default=DEFAULT_WEBSERVICE_FOLDER)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the reports to this JSON file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.realpath(args.webservice_folder))
+    from run_app import app  # pylint: disable=import-error,import-outside-toplevel
+
+    uploads = get_example_uploads(args.examples_folder)
+    large_labels = []
+    for num_atoms in args.large_structures.split(","):
+        if num_atoms.strip():
+            uploads.append(get_large_upload(int(num_atoms)))
+            large_labels.append(uploads[-1].label)
+    labels = sorted(set(upload.label for upload in uploads))
+    if args.mix:
+        weights = parse_mix(args.mix)
+        unknown = set(weights).difference(labels)
+        if unknown:
+            parser.error(
+                "Unknown formats in --mix: {}; available: {}".format(
+                    ", ".join(sorted(unknown)), ", ".join(labels)
+                )
+            )
+        if any(weight < 0 for weight in weights.values()):
+            parser.error("The weights in --mix cannot be negative")
+        # The structures requested with --large-structures are sent even if
+        # they are not in the mix
+        for label in large_labels:
+            weights.setdefault(label, 1.0)
+        if sum(weights.values()) <= 0:
+            parser.error("The total weight of the formats in --mix must be positive")
+    else:
+        weights = {label: 1.0 for label in labels}
+
+    if args.server == "testclient":
+        sender = TestClientSender(app)
+    else:
+        sender = WSGIServerSender(app)
+    reports = {}
+    try:
+        for concurrency in args.concurrency.split(","):
+            concurrency = int(concurrency)
+            elapsed, results = run_load(
+                sender, uploads, weights, concurrency, args.requests, args.seed
+            )
+            reports[concurrency] = get_report(elapsed, results)
+            print_report(concurrency, reports[concurrency])
+    finally:
+        sender.close()
+
+    if args.json:
+        with open(args.json, "w") as fhandle:
+            json.dump(reports, fhandle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
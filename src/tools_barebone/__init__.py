@@ -38,6 +38,42 @@ def get_style_version(request):
     return request.environ.get("HTTP_X_APP_STYLE", "")
 
 
+def get_client_address(request):
+    """Return a string identifying the client that sent the request.
+
+    This is the content of the `X-Forwarded-For` header, set by the
+    reverse proxy in front of the app, or the remote address if the
+    request was not proxied.
+    """
+    return request.headers.get("X-Forwarded-For", request.remote_addr)
+
+
+def get_proxied_client_address(request, trusted_proxies=1):
+    """Return the address of the client as seen by the trusted proxies.
+
+    Each reverse proxy appends the address it received the request from to
+    the `X-Forwarded-For` header sent by the client (which can contain
+    anything), so only the entries added by the proxies in front of the
+    app can be trusted. As for werkzeug's `ProxyFix(x_for=...)`, the
+    client is the entry `trusted_proxies` positions from the right (the
+    rightmost one for a single reverse proxy, the second-to-last one if
+    e.g. a load balancer is in front of it). Use this, rather than
+    `get_client_address`, to identify clients e.g. for rate limiting.
+
+    :param request: a Flask request
+    :param trusted_proxies: the number of proxies in front of the app;
+        with 0, the header is ignored
+    :return: the address, or the remote address if the header has fewer
+        entries than trusted proxies
+    """
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if forwarded_for and trusted_proxies > 0:
+        addresses = [address.strip() for address in forwarded_for.split(",")]
+        if len(addresses) >= trusted_proxies and addresses[-trusted_proxies]:
+            return addresses[-trusted_proxies]
+    return request.remote_addr
+
+
 def get_tools_barebone_version():
     """Return the version of tools-barebone."""
     return __version__
@@ -106,7 +142,7 @@ def generate_log(  # pylint: disable=too-many-arguments
         "reason": reason,
         "request": str(request.headers),
         "call_source": call_source,
-        "source": request.headers.get("X-Forwarded-For", request.remote_addr),
+        "source": get_client_address(request),
         "time": datetime.datetime.now().isoformat(),
     }
     logdict.update(extra)
@@ -0,0 +1,301 @@
+"""Admission control and per-client rate limiting.
+
+Parsing structures and running the compute views can be expensive, so
+a burst of large uploads (possibly from a single client) could make the
+app slow for everybody. This module provides:
+
+- a concurrency limiter, that lets at most a given number of requests
+  run at the same time in each worker process, and makes a bounded number
+  of additional requests wait in a queue. When the queue is full (or the
+  wait is too long) the request is rejected with a 503 error;
+- a token bucket per client, whose state is stored in a SQLite file so
+  that it is shared among all the (mod_wsgi) processes of the app. When
+  a client has no tokens left, the request is rejected with a 429 error.
+
+Both rejections set the `Retry-After` header.
+"""
+
+import contextlib
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import flask
+
+from . import get_proxied_client_address
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted.
+
+    :param status_code: the HTTP status code to return to the client
+    :param retry_after: the number of seconds after which the client
+        should retry
+    :param message: a message for the client
+    """
+
+    def __init__(self, status_code, retry_after, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.message = message
+
+
+class ConcurrencyLimiter:
+    """A semaphore with a bounded wait queue.
+
+    :param max_concurrent: maximum number of requests running at the same time
+    :param max_queued: maximum number of requests waiting for a free slot
+    :param queue_timeout: maximum time (in seconds) a request waits for a
+        free slot before being rejected
+    :param retry_after: value (in seconds) suggested to rejected clients
+    """
+
+    def __init__(self, max_concurrent, max_queued, queue_timeout, retry_after):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+
+    def acquire(self):
+        """Acquire a slot, waiting in the queue if needed.
+
+        :raise AdmissionRejected: if the queue is full or the wait times out
+        """
+        with self._condition:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                return
+            if self._waiting >= self.max_queued:
+                raise AdmissionRejected(
+                    503, self.retry_after, "The server is busy, please retry later."
+                )
+            self._waiting += 1
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self._active < self.max_concurrent, self.queue_timeout
+                )
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                raise AdmissionRejected(
+                    503, self.retry_after, "The server is busy, please retry later."
+                )
+            self._active += 1
+
+    def release(self):
+        """Release a slot acquired with `acquire`."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+class TokenBucketStore:
+    """Token buckets (one per client) stored in a SQLite file.
+
+    Each client has a bucket of at most `burst` tokens, refilled at a rate
+    of `rate` tokens per second; each request consumes one token.
+    Using a file allows to share the state among processes.
+
+    :param path: the path of the SQLite file (created if missing)
+    :param rate: the refill rate, in tokens per second
+    :param burst: the capacity of each bucket
+    """
+
+    _PRUNE_EVERY = 1000
+
+    def __init__(self, path, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        # next() on a count is atomic, so this is safe to use from threads
+        self._calls = itertools.count(1)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with contextlib.closing(sqlite3.connect(path, timeout=10)) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets "
+                    "(client TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+                )
+
+    def _get_connection(self):
+        # sqlite3 connections cannot be shared among threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def consume(self, client):
+        """Try to consume one token from the bucket of `client`.
+
+        :return: 0 if the token was consumed, otherwise the number of
+            seconds after which a token will be available
+        """
+        connection = self._get_connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE client = ?", (client,)
+            ).fetchone()
+            if row is None:
+                tokens = float(self.burst)
+            else:
+                tokens = min(float(self.burst), row[0] + (now - row[1]) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (client, tokens, updated) "
+                "VALUES (?, ?, ?)",
+                (client, tokens, now),
+            )
+            if next(self._calls) % self._PRUNE_EVERY == 0:
+                # Buckets that had the time to refill completely are
+                # equivalent to missing ones
+                connection.execute(
+                    "DELETE FROM buckets WHERE updated < ?",
+                    (now - self.burst / self.rate,),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def refund(self, client):
+        """Give back the token consumed by a request of `client` that was
+        not served after all (e.g. rejected because the server is busy)."""
+        connection = self._get_connection()
+        connection.execute(
+            "UPDATE buckets SET tokens = MIN(tokens + 1.0, ?) WHERE client = ?",
+            (float(self.burst), client),
+        )
+
+
+class AdmissionController:
+    """Apply a concurrency limit and a per-client rate limit to requests.
+
+    Any of the two limits can be disabled by passing `None`.
+
+    :param limiter: a `ConcurrencyLimiter` instance, or None
+    :param buckets: a `TokenBucketStore` instance, or None
+    :param trusted_proxies: the number of proxies in front of the app,
+        used to find the address of the client in the `X-Forwarded-For`
+        header (see `get_proxied_client_address`)
+    """
+
+    def __init__(self, limiter=None, buckets=None, trusted_proxies=1):
+        self.limiter = limiter
+        self.buckets = buckets
+        self.trusted_proxies = trusted_proxies
+
+    @classmethod
+    def from_config(cls, config, default_state_file):
+        """Create a controller from the `admission_control` section of the
+        config.yaml file.
+
+        :param config: a dictionary with the content of the section
+        :param default_state_file: the SQLite file to use to share the
+            rate-limiting state if not specified in the config
+        """
+        limiter = None
+        buckets = None
+        if config.get("max_concurrent_requests") is not None:
+            limiter = ConcurrencyLimiter(
+                max_concurrent=int(config["max_concurrent_requests"]),
+                max_queued=int(config.get("max_queued_requests", 0)),
+                queue_timeout=float(config.get("queue_timeout", 10)),
+                retry_after=int(config.get("retry_after", 5)),
+            )
+        if config.get("rate_limit_per_minute") is not None:
+            rate = float(config["rate_limit_per_minute"]) / 60.0
+            buckets = TokenBucketStore(
+                path=config.get("state_file", default_state_file),
+                rate=rate,
+                burst=int(config.get("rate_limit_burst", max(1, math.ceil(rate)))),
+            )
+        return cls(
+            limiter=limiter,
+            buckets=buckets,
+            trusted_proxies=int(config.get("trusted_proxies", 1)),
+        )
+
+    def enter(self, client):
+        """Admit a request from `client`, to be followed by a call to `leave`.
+
+        :raise AdmissionRejected: if the request cannot be admitted
+        """
+        if self.buckets is not None:
+            wait = self.buckets.consume(client)
+            if wait > 0:
+                raise AdmissionRejected(
+                    429,
+                    math.ceil(wait),
+                    "Too many requests, please retry later.",
+                )
+        if self.limiter is not None:
+            try:
+                self.limiter.acquire()
+            except AdmissionRejected:
+                # Requests rejected because the server is busy must not
+                # count against the rate limit of the client
+                if self.buckets is not None:
+                    self.buckets.refund(client)
+                raise
+
+    def leave(self):
+        """Mark the end of a request admitted with `enter`."""
+        if self.limiter is not None:
+            self.limiter.release()
+
+    @contextlib.contextmanager
+    def admit(self, client):
+        """Context manager to wrap expensive code, e.g. calls to
+        `get_structure_tuple`, with admission control."""
+        self.enter(client)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def init_app(self, app, blueprint_names=("compute",)):
+        """Apply admission control to all views of the given blueprints.
+
+        :param app: the Flask app
+        :param blueprint_names: the names of the blueprints to limit
+        """
+
+        @app.before_request
+        def admission_control_before_request():
+            if flask.request.blueprint not in blueprint_names:
+                return None
+            try:
+                self.enter(
+                    get_proxied_client_address(flask.request, self.trusted_proxies)
+                )
+            except AdmissionRejected as exc:
+                response = flask.make_response(exc.message, exc.status_code)
+                response.headers["Retry-After"] = str(exc.retry_after)
+                return response
+            flask.g.admission_controlled = True
+            return None
+
+        @app.teardown_request
+        def admission_control_teardown_request(exc):  # pylint: disable=unused-argument
+            if flask.g.pop("admission_controlled", False):
+                self.leave()
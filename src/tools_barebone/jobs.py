@@ -0,0 +1,258 @@
+"""Background jobs for long-running compute requests.
+
+Views of the compute blueprint normally run synchronously, so a request
+taking more than a few tens of seconds hits the timeouts of the reverse
+proxies and keeps a worker busy. A view can instead submit the expensive
+part as a background job and return immediately: the job runs in a
+local pool of threads, and its state and result are kept in a SQLite
+file (shared among all the processes of the app) until they expire.
+The page can then poll the `/jobs/<job_id>/` endpoint.
+
+Usage, in the compute blueprint::
+
+    from tools_barebone.jobs import background_job, job_accepted_response
+
+    @background_job
+    def compute_bands(structure_tuple):
+        # Runs in a worker thread, with the Flask app context;
+        # the return value must be JSON-serializable
+        return {"bands": ...}
+
+    @blueprint.route("/process_structure/", methods=["POST"])
+    def process_structure():
+        structure_tuple = ...
+        return job_accepted_response(compute_bands.submit(structure_tuple))
+"""
+
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import traceback
+
+import flask
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """State and results of the jobs, stored in a SQLite file.
+
+    :param path: the path of the SQLite file (created if missing)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with contextlib.closing(sqlite3.connect(path, timeout=10)) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, "
+                    "status TEXT, owner INTEGER, created REAL, updated REAL, "
+                    "expires REAL, result TEXT, error TEXT)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)"
+                )
+
+    def _get_connection(self):
+        # sqlite3 connections cannot be shared among threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            self._local.connection = connection
+        return connection
+
+    def create(self, job_id, ttl):
+        """Add a new queued job, owned by the current process, that will
+        be forgotten after `ttl` seconds."""
+        now = time.time()
+        with self._get_connection() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, owner, created, updated, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, os.getpid(), now, now, now + ttl),
+            )
+
+    def update(self, job_id, status, result=None, error=None):
+        """Set the status of a job and, if finished, its result or error."""
+        with self._get_connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, updated = ?, result = ?, error = ? "
+                "WHERE id = ?",
+                (
+                    status,
+                    time.time(),
+                    None if result is None else json.dumps(result),
+                    error,
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id):
+        """Return a dictionary describing the job, or None if the job does
+        not exist or has expired."""
+        row = (
+            self._get_connection()
+            .execute(
+                "SELECT status, owner, created, updated, result, error FROM jobs "
+                "WHERE id = ? AND expires > ?",
+                (job_id, time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        status, owner, created, updated, result, error = row
+        if status in (QUEUED, RUNNING) and not _process_exists(owner):
+            # The process was recycled or killed: the job will never complete
+            status = FAILED
+            error = "The job was interrupted, please submit it again."
+            self.update(job_id, status, error=error)
+        return {
+            "job_id": job_id,
+            "status": status,
+            "created": created,
+            "updated": updated,
+            "result": None if result is None else json.loads(result),
+            "error": error,
+        }
+
+    def purge_expired(self):
+        """Delete all expired jobs."""
+        with self._get_connection() as connection:
+            connection.execute("DELETE FROM jobs WHERE expires <= ?", (time.time(),))
+
+
+def _process_exists(pid):
+    """Return True if a process with the given PID is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """Run jobs in a local pool of threads, recording them in a `JobStore`.
+
+    :param store: a `JobStore` instance
+    :param max_workers: the number of threads of the pool (per process)
+    :param result_ttl: the number of seconds after which a job and its
+        result are deleted
+    """
+
+    def __init__(self, store, max_workers=2, result_ttl=3600):
+        self.store = store
+        self.result_ttl = result_ttl
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tools-barebone-job"
+        )
+
+    @classmethod
+    def from_config(cls, config, default_state_file):
+        """Create a queue from the `jobs` section of the config.yaml file.
+
+        :param config: a dictionary with the content of the section
+        :param default_state_file: the SQLite file to use to store the
+            jobs if not specified in the config
+        """
+        return cls(
+            store=JobStore(config.get("state_file", default_state_file)),
+            max_workers=int(config.get("max_workers", 2)),
+            result_ttl=float(config.get("result_ttl", 3600)),
+        )
+
+    def submit(self, func, *args, **kwargs):
+        """Run `func(*args, **kwargs)` in the background, in the context
+        of the current Flask app.
+
+        :return: the ID of the new job
+        """
+        # pylint: disable=protected-access
+        app = flask.current_app._get_current_object()
+        job_id = secrets.token_urlsafe(16)
+        self.store.purge_expired()
+        self.store.create(job_id, self.result_ttl)
+        self._executor.submit(self._run, app, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, app, job_id, func, args, kwargs):
+        # Exceptions raised here would be silently kept in the Future:
+        # whatever fails (the job, serializing its result, or writing it to
+        # the store), log it and mark the job as failed
+        try:
+            self.store.update(job_id, RUNNING)
+            with app.app_context():
+                result = func(*args, **kwargs)
+            self.store.update(job_id, DONE, result=result)
+        except Exception:  # pylint: disable=broad-except
+            app.logger.error("Job %s failed:\n%s", job_id, traceback.format_exc())
+            try:
+                self.store.update(job_id, FAILED, error="The computation failed.")
+            except Exception:  # pylint: disable=broad-except
+                app.logger.error(
+                    "Could not mark job %s as failed:\n%s",
+                    job_id,
+                    traceback.format_exc(),
+                )
+
+    def init_app(self, app, url_prefix="/jobs"):
+        """Register the queue on the app, and the endpoint to poll jobs.
+
+        `GET <url_prefix>/<job_id>/` returns a JSON with the `status` of
+        the job (one of 'queued', 'running', 'done', 'failed') and, when
+        finished, its `result` or `error`.
+        """
+        app.extensions["tools_barebone_jobs"] = self
+        blueprint = flask.Blueprint("jobs", __name__, url_prefix=url_prefix)
+
+        @blueprint.route("/<job_id>/")
+        def job_status(job_id):
+            job = self.store.get(job_id)
+            if job is None:
+                return flask.jsonify({"job_id": job_id, "error": "Unknown job"}), 404
+            return flask.jsonify(job)
+
+        app.register_blueprint(blueprint)
+
+
+def get_job_queue():
+    """Return the `JobQueue` registered on the current app."""
+    return flask.current_app.extensions["tools_barebone_jobs"]
+
+
+def background_job(func):
+    """Decorator to opt a function in to run as a background job.
+
+    The decorated function can still be called directly; in addition,
+    `func.submit(*args, **kwargs)` runs it in the job queue of the current
+    app and returns the job ID.
+    """
+
+    @functools.wraps(func)
+    def submit(*args, **kwargs):
+        return get_job_queue().submit(func, *args, **kwargs)
+
+    func.submit = submit
+    return func
+
+
+def job_accepted_response(job_id):
+    """Return a 202 response pointing to the status endpoint of a job."""
+    status_url = flask.url_for("jobs.job_status", job_id=job_id)
+    response = flask.jsonify({"job_id": job_id, "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
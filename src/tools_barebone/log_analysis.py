@@ -0,0 +1,313 @@
+"""Streaming analysis of the request logs written with `logme`.
+
+Each line of the logs contains a JSON document generated by
+`generate_log`, after a prefix with the time, level and function name.
+The logs rotate every night, and rotated files may be compressed
+with gzip. This module reads the current and the rotated logs line by
+line (so in constant memory) and aggregates, per file format, the
+number of requests for each logged reason and the size distribution of
+the uploaded files, and per client, the number of requests and bytes.
+
+The offset reached in each file and the aggregates are saved in a state
+file, so that each run only needs to process the lines added since the
+previous one. Files are identified by a hash of their first line, so
+that they are recognized also after being rotated and compressed.
+
+Usage::
+
+    python -m tools_barebone.log_analysis webservice/logs/requests.log
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+import sys
+
+# Number of size buckets per power of two in the size histograms
+BUCKETS_PER_OCTAVE = 4
+
+# Separator between the logging prefix and the JSON document
+LOG_SEPARATOR = b" ^ "
+
+
+def get_size_bucket(size):
+    """Return the histogram bucket of a file size in bytes."""
+    return int(math.log2(size + 1) * BUCKETS_PER_OCTAVE)
+
+
+def get_bucket_upper_bound(bucket):
+    """Return the largest size (in bytes) falling in a histogram bucket."""
+    return math.ceil(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE)) - 2
+
+
+def new_stats():
+    """Return the empty aggregates."""
+    return {"lines": 0, "malformed_lines": 0, "formats": {}, "clients": {}}
+
+
+def update_stats(stats, line):
+    """Add a log line (as bytes) to the aggregates."""
+    stats["lines"] += 1
+    try:
+        logdict = json.loads(line.partition(LOG_SEPARATOR)[2])
+        fileformat = str(logdict["data"]["fileformat"])
+        size = len(logdict["data"]["filecontent"].encode("utf-8"))
+        reason = str(logdict["reason"])
+        client = str(logdict["source"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        stats["malformed_lines"] += 1
+        return
+
+    format_stats = stats["formats"].setdefault(
+        fileformat, {"requests": 0, "bytes": 0, "reasons": {}, "sizes": {}}
+    )
+    format_stats["requests"] += 1
+    format_stats["bytes"] += size
+    format_stats["reasons"][reason] = format_stats["reasons"].get(reason, 0) + 1
+    # JSON keys are strings: use strings also in memory, so that the
+    # aggregates are the same after being saved and loaded
+    bucket = str(get_size_bucket(size))
+    format_stats["sizes"][bucket] = format_stats["sizes"].get(bucket, 0) + 1
+
+    client_stats = stats["clients"].setdefault(client, {"requests": 0, "bytes": 0})
+    client_stats["requests"] += 1
+    client_stats["bytes"] += size
+
+
+def open_log(path):
+    """Open a (possibly gzipped) log file for reading in binary mode."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def get_log_files(log_path):
+    """Return the current log file and its rotated versions, oldest first."""
+    paths = [
+        path for path in glob.glob(glob.escape(log_path) + ".*") if os.path.isfile(path)
+    ]
+    paths.sort(key=os.path.getmtime)
+    if os.path.isfile(log_path):
+        paths.append(log_path)
+    return paths
+
+
+def process_file(path, file_state, stats, is_current):
+    """Aggregate the lines of a log file that were not processed yet.
+
+    :param path: the path of the file
+    :param file_state: the state of the file from a previous run
+        (a dict with the `offset` reached and whether the file is
+        `complete`), or an empty dict
+    :param stats: the aggregates, updated in place
+    :param is_current: False if the file was rotated, i.e. it will not
+        change anymore
+
+    :return: the new state of the file
+    """
+    offset = file_state.get("offset", 0)
+    with open_log(path) as fhandle:
+        fhandle.seek(offset)
+        for line in fhandle:
+            if not line.endswith(b"\n"):
+                # Incomplete line, still being written
+                break
+            update_stats(stats, line)
+            offset += len(line)
+        else:
+            return {"offset": offset, "complete": not is_current}
+    return {"offset": offset, "complete": False}
+
+
+def get_fingerprint(path):
+    """Return a string identifying a log file from its first line, or
+    None if the file does not contain a full line yet."""
+    with open_log(path) as fhandle:
+        first_line = fhandle.readline()
+    if not first_line.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first_line).hexdigest()
+
+
+def analyze(log_path, state=None):
+    """Process all new lines of the current and rotated logs.
+
+    :param log_path: the path of the current log file
+    :param state: the state returned by a previous call, or None to
+        start from scratch
+
+    :return: the new state, whose `stats` key contains the aggregates
+    """
+    if state is None:
+        state = {"files": {}, "stats": new_stats()}
+    for path in get_log_files(log_path):
+        fingerprint = get_fingerprint(path)
+        if fingerprint is None:
+            continue
+        file_state = state["files"].get(fingerprint, {})
+        if file_state.get("complete"):
+            continue
+        state["files"][fingerprint] = process_file(
+            path, file_state, state["stats"], is_current=(path == log_path)
+        )
+    return state
+
+
+def get_size_quantile(sizes, quantile):
+    """Return an upper bound for a quantile of a size histogram."""
+    total = sum(sizes.values())
+    cumulative = 0
+    for bucket in sorted(sizes, key=int):
+        cumulative += sizes[bucket]
+        if cumulative >= quantile * total:
+            return get_bucket_upper_bound(int(bucket))
+    return 0
+
+
+def format_table(headers, rows):
+    """Return a string with a plain-text table."""
+    widths = [
+        max(len(str(value)) for value in column) for column in zip(headers, *rows)
+    ]
+    lines = [
+        "  ".join(str(value).rjust(width) for value, width in zip(row, widths))
+        for row in [headers] + rows
+    ]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def format_report(stats, success_reasons=("OK",), top=20):
+    """Return a string with the tables summarizing the aggregates.
+
+    :param stats: the aggregates
+    :param success_reasons: the logged reasons that do not indicate a failure
+    :param top: the number of clients to show
+    """
+    formats = stats["formats"]
+
+    failures_rows = []
+    for fileformat, format_stats in formats.items():
+        failures = sum(
+            count
+            for reason, count in format_stats["reasons"].items()
+            if reason not in success_reasons
+        )
+        reasons = ", ".join(
+            "{}: {}".format(reason, count)
+            for reason, count in sorted(
+                format_stats["reasons"].items(), key=lambda item: -item[1]
+            )
+        )
+        failures_rows.append(
+            [
+                fileformat,
+                format_stats["requests"],
+                failures,
+                "{:.1f}%".format(100 * failures / format_stats["requests"]),
+                reasons,
+            ]
+        )
+    failures_rows.sort(key=lambda row: -row[2])
+
+    sizes_rows = [
+        [
+            fileformat,
+            format_stats["requests"],
+            get_size_quantile(format_stats["sizes"], 0.5),
+            get_size_quantile(format_stats["sizes"], 0.9),
+            get_size_quantile(format_stats["sizes"], 0.99),
+            get_size_quantile(format_stats["sizes"], 1.0),
+            format_stats["bytes"],
+        ]
+        for fileformat, format_stats in sorted(formats.items())
+    ]
+
+    clients_rows = [
+        [client, client_stats["requests"], client_stats["bytes"]]
+        for client, client_stats in sorted(
+            stats["clients"].items(), key=lambda item: -item[1]["bytes"]
+        )[:top]
+    ]
+
+    return "\n\n".join(
+        [
+            "Processed {} lines ({} malformed)".format(
+                stats["lines"], stats["malformed_lines"]
+            ),
+            "Failures per format\n"
+            + format_table(
+                ["format", "requests", "failures", "failed", "reasons"],
+                failures_rows,
+            ),
+            "Upload sizes per format (bytes, upper bounds)\n"
+            + format_table(
+                ["format", "uploads", "p50", "p90", "p99", "max", "total"],
+                sizes_rows,
+            ),
+            "Top {} clients by uploaded bytes\n".format(top)
+            + format_table(["client", "requests", "bytes"], clients_rows),
+        ]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Aggregate the JSON request logs of a tools-barebone app."
+    )
+    parser.add_argument(
+        "log_path", help="The current log file, e.g. webservice/logs/requests.log"
+    )
+    parser.add_argument(
+        "--state-file",
+        help="Where to save offsets and aggregates between runs "
+        "(default: requests-analysis.json next to the log file)",
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Ignore the saved state and start over"
+    )
+    parser.add_argument(
+        "--success-reason",
+        action="append",
+        help="A logged reason that is not a failure (can be repeated; default: OK)",
+    )
+    parser.add_argument("--top", type=int, default=20, help="Number of clients to show")
+    parser.add_argument(
+        "--json", action="store_true", help="Print the raw aggregates as JSON"
+    )
+    args = parser.parse_args(argv)
+
+    state_file = args.state_file or os.path.join(
+        os.path.dirname(os.path.abspath(args.log_path)), "requests-analysis.json"
+    )
+    state = None
+    if not args.reset and os.path.exists(state_file):
+        with open(state_file) as fhandle:
+            state = json.load(fhandle)
+
+    state = analyze(args.log_path, state)
+
+    # Write and rename, to avoid corrupting the state if interrupted
+    with open(state_file + ".tmp", "w") as fhandle:
+        json.dump(state, fhandle)
+    os.replace(state_file + ".tmp", state_file)
+
+    if args.json:
+        json.dump(state["stats"], sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        print(
+            format_report(
+                state["stats"],
+                success_reasons=tuple(args.success_reason or ["OK"]),
+                top=args.top,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
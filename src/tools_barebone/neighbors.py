@@ -0,0 +1,218 @@
+"""Neighbor search in periodic structures, using cell lists.
+
+All functions work on structure tuples (cell, positions, numbers) as
+returned by `get_structure_tuple`, with positions in fractional
+coordinates, and treat the structure as periodic in all directions.
+
+The atoms are sorted into bins (cells of the cell list) at least as large
+as the cutoff along each direction, so that only atoms in neighboring bins
+need to be compared: the cost scales linearly with the number of atoms.
+All loops over atoms are vectorized with NumPy (the only Python loop is
+over the few tens of neighboring bin offsets).
+
+The work still grows with the cube of the ratio between the cutoff and the
+cell size, and with the number of pairs found: uploaded structures with
+tiny cells or very dense atoms are rejected with a ValueError instead
+(see `MAX_CUTOFF_TO_WIDTH` and `MAX_ESTIMATED_PAIRS`).
+"""
+
+import itertools
+import math
+
+import numpy as np
+from ase.data import covalent_radii
+
+# Maximum ratio between the cutoff and the smallest distance between opposite
+# faces of the cell (the number of periodic images to check grows with the
+# cube of this ratio)
+MAX_CUTOFF_TO_WIDTH = 10.0
+# Maximum number of pairs expected within the cutoff, estimated from the
+# average density of atoms
+MAX_ESTIMATED_PAIRS = 5_000_000
+
+
+def get_neighbor_pairs(cell, positions, cutoff):
+    """
+    Return all pairs of atoms closer than `cutoff`, including periodic images.
+
+    Each pair is returned only once: if (i, j, shift) is returned,
+    (j, i, -shift) is not.
+
+    :param cell: the 3x3 cell, one lattice vector per row (in angstrom)
+    :param positions: a Nx3 list of fractional coordinates
+    :param cutoff: the maximum distance (in angstrom)
+
+    :return: a tuple (first, second, shifts, distances) of NumPy arrays: the
+        atom `second[k]`, translated by the lattice vectors
+        `shifts[k] @ cell`, is at distance `distances[k]` from atom `first[k]`.
+    :raise ValueError: if the cell is singular, the cutoff is not positive,
+        or the search would be too expensive (the cell is much smaller than
+        the cutoff, or too many pairs are expected)
+    """
+    cell = np.asarray(cell, dtype=float)
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    num_atoms = len(positions)
+    if cutoff <= 0:
+        raise ValueError("The cutoff must be positive")
+    volume = abs(np.linalg.det(cell))
+    if volume < 1e-10:
+        raise ValueError("The cell is singular")
+
+    # Wrap the atoms in the cell, remembering the translation applied
+    translations = np.floor(positions)
+    wrapped = positions - translations
+    cartesian = wrapped @ cell
+
+    # Distance between opposite faces of the cell, along each direction
+    widths = volume / np.linalg.norm(
+        np.cross(np.roll(cell, -1, axis=0), np.roll(cell, -2, axis=0)), axis=1
+    )
+    if cutoff > MAX_CUTOFF_TO_WIDTH * widths.min():
+        raise ValueError(
+            "The cell is too small ({:.3g} angstrom between opposite faces) "
+            "for a cutoff of {:.3g} angstrom".format(widths.min(), cutoff)
+        )
+    estimated_pairs = num_atoms**2 / volume * 4.0 / 3.0 * math.pi * cutoff**3
+    if estimated_pairs > MAX_ESTIMATED_PAIRS:
+        raise ValueError(
+            "Too many pairs of atoms within {:.3g} angstrom (about {:.3g})".format(
+                cutoff, estimated_pairs
+            )
+        )
+    # Bins at least as large as the cutoff, but not many more than the atoms
+    max_bins = max(1, int(round((4 * num_atoms) ** (1.0 / 3.0))))
+    num_bins = np.clip(np.floor(widths / cutoff).astype(int), 1, max_bins)
+    # How many bins away a neighbor can be, along each direction
+    reach = np.ceil(cutoff * num_bins / widths - 1e-12).astype(int)
+
+    atom_bins = np.minimum(np.floor(wrapped * num_bins).astype(int), num_bins - 1)
+    atom_bin_index = np.ravel_multi_index(atom_bins.T, num_bins)
+    atoms_by_bin = np.argsort(atom_bin_index, kind="stable")
+    bin_counts = np.bincount(atom_bin_index, minlength=np.prod(num_bins))
+    bin_starts = np.cumsum(bin_counts) - bin_counts
+
+    first, second, shifts, distances = [], [], [], []
+    offsets = itertools.product(*(range(-r, r + 1) for r in reach))
+    for offset in offsets:
+        # Only half of the offsets: the others give the same pairs reversed
+        if offset < (0, 0, 0):
+            continue
+        neighbor_bins = atom_bins + offset
+        image_shifts = np.floor_divide(neighbor_bins, num_bins)
+        neighbor_bins -= image_shifts * num_bins
+        neighbor_bin_index = np.ravel_multi_index(neighbor_bins.T, num_bins)
+
+        # All (atom, candidate) pairs, with the candidates in the neighbor bin
+        counts = bin_counts[neighbor_bin_index]
+        pair_first = np.repeat(np.arange(num_atoms), counts)
+        position_in_bin = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts
+        )
+        pair_second = atoms_by_bin[
+            np.repeat(bin_starts[neighbor_bin_index], counts) + position_in_bin
+        ]
+        pair_shifts = image_shifts[pair_first]
+        if offset == (0, 0, 0):
+            mask = pair_first < pair_second
+            pair_first = pair_first[mask]
+            pair_second = pair_second[mask]
+            pair_shifts = pair_shifts[mask]
+
+        vectors = cartesian[pair_second] + pair_shifts @ cell - cartesian[pair_first]
+        squared = np.einsum("ij,ij->i", vectors, vectors)
+        mask = squared <= cutoff**2
+        first.append(pair_first[mask])
+        second.append(pair_second[mask])
+        # Shifts with respect to the original (unwrapped) positions
+        shifts.append(
+            pair_shifts[mask]
+            + translations[pair_first[mask]]
+            - translations[pair_second[mask]]
+        )
+        distances.append(np.sqrt(squared[mask]))
+
+    return (
+        np.concatenate(first),
+        np.concatenate(second),
+        np.concatenate(shifts).astype(int),
+        np.concatenate(distances),
+    )
+
+
+def find_duplicate_atoms(structure_tuple, tolerance=0.5):
+    """
+    Return the pairs of atoms that overlap (e.g. duplicated by the
+    expansion of the symmetry operations of a CIF file).
+
+    :param structure_tuple: a tuple (cell, positions, numbers)
+    :param tolerance: the distance (in angstrom) below which atoms overlap
+
+    :return: a list of (first, second, distance) tuples
+    """
+    first, second, _, distances = get_neighbor_pairs(
+        structure_tuple[0], structure_tuple[1], tolerance
+    )
+    return list(zip(first.tolist(), second.tolist(), distances.tolist()))
+
+
+def merge_duplicate_atoms(structure_tuple, tolerance=0.5):
+    """
+    Return a new structure tuple where overlapping atoms of the same element
+    are replaced by a single atom (the first one). Overlapping atoms of
+    different elements are kept.
+
+    :param structure_tuple: a tuple (cell, positions, numbers)
+    :param tolerance: the distance (in angstrom) below which atoms overlap
+    """
+    cell, positions, numbers = structure_tuple
+    numbers_array = np.asarray(numbers)
+    first, second, _, _ = get_neighbor_pairs(cell, positions, tolerance)
+    mask = (numbers_array[first] == numbers_array[second]) & (first != second)
+    first, second = first[mask], second[mask]
+
+    # Label each group of overlapping atoms with its smallest index
+    labels = np.arange(len(numbers_array))
+    while True:
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, first, labels[second])
+        np.minimum.at(new_labels, second, labels[first])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    keep = labels == np.arange(len(numbers_array))
+
+    return (
+        cell,
+        np.asarray(positions, dtype=float)[keep].tolist(),
+        numbers_array[keep].tolist(),
+    )
+
+
+def get_bonds(structure_tuple, tolerance_factor=1.2):
+    """
+    Return the bonds of a structure, ready to be drawn by a visualizer.
+
+    Two atoms are bonded if their distance is at most `tolerance_factor`
+    times the sum of their covalent radii.
+
+    :param structure_tuple: a tuple (cell, positions, numbers)
+    :param tolerance_factor: the tolerance on the sum of the covalent radii
+
+    :return: a list of [first, second, [n1, n2, n3]] lists, meaning that the
+        atom `first` is bonded to the atom `second` translated by
+        n1, n2 and n3 times the three lattice vectors, respectively.
+    """
+    cell, positions, numbers = structure_tuple
+    if len(numbers) == 0:
+        return []
+    radii = covalent_radii[np.asarray(numbers)]
+    cutoff = 2 * tolerance_factor * radii.max()
+    first, second, shifts, distances = get_neighbor_pairs(cell, positions, cutoff)
+    mask = distances <= tolerance_factor * (radii[first] + radii[second])
+    return [
+        [int(atom_first), int(atom_second), shift]
+        for atom_first, atom_second, shift in zip(
+            first[mask], second[mask], shifts[mask].tolist()
+        )
+    ]
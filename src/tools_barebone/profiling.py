@@ -0,0 +1,404 @@
+"""On-demand profiling of requests in production.
+
+When a route or a file format becomes slow with real traffic, profiling can
+be armed for the next N matching requests (filtered by route and/or by
+the `fileformat` form field): each of them is run under `cProfile` (or
+`tracemalloc`), and the profile is written to the output folder together
+with a JSON file with the route, file format, upload size, duration and
+status of the request. After N captures, profiling disarms itself.
+
+The armed state is stored in a small JSON file, shared among all the
+processes of the app. While profiling is not armed, each process only
+checks if the file exists once per second: the cost per request is a
+call to `time.monotonic()`.
+
+Profiling can be armed from the command line on the server::
+
+    python -m tools_barebone.profiling arm webservice/state/profiling.json \\
+        --count 5 --fileformat cif-pymatgen
+
+or, if a key is configured, via HTTP::
+
+    curl -X POST -H "X-Profiling-Key: <key>" -d count=5 -d route=/compute/ \\
+        https://<host>/<tool>/profiling/arm
+
+Inspect the profiles with e.g. `python -m pstats <file>.prof` or snakeviz.
+"""
+
+import argparse
+import cProfile
+import fcntl
+import hmac
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+import flask
+
+CPROFILE = "cprofile"
+TRACEMALLOC = "tracemalloc"
+
+# Maximum number of requests that can be captured at once, to bound the
+# disk space used by the profiles
+MAX_COUNT = 100
+
+
+def arm(state_file, count, mode=CPROFILE, route=None, fileformat=None, ttl=3600):
+    """Arm profiling for the next `count` matching requests.
+
+    :param state_file: the JSON file with the shared state
+    :param count: the number of requests to capture (at most MAX_COUNT)
+    :param mode: 'cprofile' (time) or 'tracemalloc' (memory allocations)
+    :param route: if given, capture only requests whose endpoint (e.g.
+        'compute.process_structure') is equal to it or whose path starts
+        with it (if it starts with '/')
+    :param fileformat: if given, capture only requests whose `fileformat`
+        form field is equal to it
+    :param ttl: the number of seconds after which profiling disarms itself
+        even if fewer requests were captured
+
+    :return: the new state
+    :raise ValueError: if the parameters are not valid
+    """
+    if mode not in (CPROFILE, TRACEMALLOC):
+        raise ValueError("Unknown profiling mode '{}'".format(mode))
+    if not 1 <= count <= MAX_COUNT:
+        raise ValueError("count must be between 1 and {}".format(MAX_COUNT))
+    state = {
+        "count": count,
+        "mode": mode,
+        "route": route or None,
+        "fileformat": fileformat or None,
+        "expires": time.time() + ttl,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+    # Write and rename, so that readers never see a partial file
+    with open(state_file + ".tmp", "w") as fhandle:
+        json.dump(state, fhandle)
+    os.replace(state_file + ".tmp", state_file)
+    return state
+
+
+def disarm(state_file):
+    """Disarm profiling."""
+    try:
+        os.remove(state_file)
+    except FileNotFoundError:
+        pass
+
+
+def read_state(state_file):
+    """Return the armed state, or None if profiling is not armed."""
+    try:
+        with open(state_file) as fhandle:
+            state = json.load(fhandle)
+    except (OSError, ValueError):
+        return None
+    if state.get("count", 0) < 1 or state.get("expires", 0) < time.time():
+        return None
+    return state
+
+
+def _matches(state, endpoint, path, get_fileformat):
+    route = state["route"]
+    if route is not None and route != endpoint:
+        if not (route.startswith("/") and path.startswith(route)):
+            return False
+    if state["fileformat"] is not None:
+        return get_fileformat() == state["fileformat"]
+    return True
+
+
+class RequestProfiler:
+    """Capture profiles of the requests of an app, when armed.
+
+    :param state_file: the JSON file with the shared armed state
+    :param output_folder: the folder where profiles are written
+    :param key: if not None, the key to pass in the `X-Profiling-Key`
+        header to arm profiling via HTTP (without a key, the HTTP
+        endpoints are not registered)
+    :param check_interval: how often (in seconds) each process checks if
+        profiling was armed
+    """
+
+    def __init__(self, state_file, output_folder, key=None, check_interval=1.0):
+        self.state_file = state_file
+        self.output_folder = output_folder
+        self.key = key
+        self.check_interval = check_interval
+        self._state = None
+        self._next_check = 0.0
+        # Only one capture at a time per process: tracemalloc is global, and
+        # from Python 3.12 only one cProfile profiler can be active at a time
+        self._capture_lock = threading.Lock()
+        self._captures = itertools.count(1)
+
+    def _get_state(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._state = read_state(self.state_file)
+        return self._state
+
+    def _claim(self, endpoint, path, get_fileformat):
+        """Take one of the remaining captures, if the request matches and
+        can be captured; return the profiling mode, or None.
+
+        Errors (e.g. a state file written by another user, that this
+        process cannot modify) are logged and never affect the request.
+        """
+        locked = False
+        try:
+            try:
+                fhandle = open(self.state_file, "r+")
+            except FileNotFoundError:
+                self._state = None
+                return None
+            with fhandle:
+                fcntl.flock(fhandle, fcntl.LOCK_EX)
+                state = json.load(fhandle)
+                if state["count"] < 1 or state["expires"] < time.time():
+                    disarm(self.state_file)
+                    self._state = None
+                    return None
+                if not _matches(state, endpoint, path, get_fileformat):
+                    return None
+                if not self._capture_lock.acquire(blocking=False):
+                    return None
+                locked = True
+                state["count"] -= 1
+                # Write the count also before removing the file, as other
+                # processes may be waiting for the lock on it
+                fhandle.seek(0)
+                fhandle.truncate()
+                json.dump(state, fhandle)
+                fhandle.flush()
+                if state["count"] == 0:
+                    disarm(self.state_file)
+                self._state = state if state["count"] else None
+                return state["mode"]
+        except Exception:  # pylint: disable=broad-except
+            if locked:
+                self._capture_lock.release()
+            # Do not try again before the next check of the state file
+            self._state = None
+            flask.current_app.logger.exception(
+                "Could not claim a profiling capture from %s", self.state_file
+            )
+            return None
+
+    def _start(self, mode):
+        """Start a capture claimed with `_claim`; return the cProfile.Profile
+        (None for tracemalloc). On failure, the capture lock is released."""
+        try:
+            if mode == TRACEMALLOC:
+                tracemalloc.start(25)
+                return None
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        except BaseException:
+            self._capture_lock.release()
+            raise
+
+    def _stop(self, capture):
+        """Stop a capture; return the profile (a cProfile.Profile, or a
+        tracemalloc snapshot)."""
+        try:
+            if capture["mode"] != TRACEMALLOC:
+                capture["profile"].disable()
+                return capture["profile"]
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                (
+                    capture["current_memory"],
+                    capture["peak_memory"],
+                ) = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return snapshot
+        finally:
+            self._capture_lock.release()
+
+    def _write(self, capture, profile, status_code):
+        """Write a profile and the metadata of its request."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        basename = os.path.join(
+            self.output_folder,
+            "{}-{}-{}-{}-{}".format(
+                time.strftime("%Y%m%d-%H%M%S"),
+                os.getpid(),
+                next(self._captures),
+                re.sub(r"[^\w.-]", "_", capture["endpoint"] or "none"),
+                re.sub(r"[^\w.-]", "_", capture["fileformat"] or "none"),
+            ),
+        )
+        if capture["mode"] == TRACEMALLOC:
+            with open(basename + ".txt", "w") as fhandle:
+                for stat in profile.statistics("lineno")[:100]:
+                    print(stat, file=fhandle)
+        else:
+            profile.dump_stats(basename + ".prof")
+        metadata = {
+            key: capture[key]
+            for key in [
+                "mode",
+                "endpoint",
+                "path",
+                "fileformat",
+                "content_length",
+                "duration",
+                "current_memory",
+                "peak_memory",
+            ]
+            if key in capture
+        }
+        metadata["status_code"] = status_code
+        with open(basename + ".json", "w") as fhandle:
+            json.dump(metadata, fhandle, indent=2)
+
+    def init_app(self, app, url_prefix="/profiling"):
+        """Capture the requests of the app when armed; if a key was given,
+        also register the endpoints to arm and disarm profiling:
+
+        - `POST <url_prefix>/arm` with the form fields `count`, and
+          optionally `mode`, `route`, `fileformat` and `ttl` (see `arm`);
+        - `POST <url_prefix>/disarm`;
+        - `GET <url_prefix>/` to get the current state.
+        """
+
+        @app.before_request
+        def profiling_before_request():
+            state = self._get_state()
+            if state is None:
+                return None
+            request = flask.request
+
+            def get_fileformat():
+                # This parses the request body: only call it if needed
+                return request.form.get("fileformat")
+
+            if not _matches(state, request.endpoint, request.path, get_fileformat):
+                return None
+            mode = self._claim(request.endpoint, request.path, get_fileformat)
+            if mode is None:
+                return None
+            capture = {
+                "mode": mode,
+                "endpoint": request.endpoint,
+                "path": request.path,
+                "fileformat": request.form.get("fileformat"),
+                "content_length": request.content_length,
+            }
+            # A failure of the profiler must never affect the request
+            try:
+                capture["profile"] = self._start(mode)
+            except Exception:  # pylint: disable=broad-except
+                app.logger.exception("Could not start profiling the request")
+                return None
+            capture["start"] = time.perf_counter()
+            flask.g.profiling_capture = capture
+            return None
+
+        @app.after_request
+        def profiling_after_request(response):
+            if "profiling_capture" in flask.g:
+                flask.g.profiling_capture["status_code"] = response.status_code
+            return response
+
+        @app.teardown_request
+        def profiling_teardown_request(exc):  # pylint: disable=unused-argument
+            capture = flask.g.pop("profiling_capture", None)
+            if capture is not None:
+                capture["duration"] = time.perf_counter() - capture["start"]
+                try:
+                    profile = self._stop(capture)
+                    self._write(capture, profile, capture.get("status_code", 500))
+                except Exception:  # pylint: disable=broad-except
+                    app.logger.exception("Could not write the profile")
+
+        if self.key is None:
+            return
+
+        blueprint = flask.Blueprint("profiling", __name__, url_prefix=url_prefix)
+
+        @blueprint.before_request
+        def check_profiling_key():
+            given_key = flask.request.headers.get("X-Profiling-Key", "")
+            if not hmac.compare_digest(given_key.encode(), self.key.encode()):
+                flask.abort(403)
+
+        @blueprint.route("/", methods=["GET"])
+        def profiling_state():
+            return flask.jsonify({"armed": read_state(self.state_file)})
+
+        @blueprint.route("/arm", methods=["POST"])
+        def profiling_arm():
+            form = flask.request.form
+            try:
+                state = arm(
+                    self.state_file,
+                    count=int(form.get("count", 1)),
+                    mode=form.get("mode", CPROFILE),
+                    route=form.get("route"),
+                    fileformat=form.get("fileformat"),
+                    ttl=float(form.get("ttl", 3600)),
+                )
+            except ValueError as exc:
+                return flask.jsonify({"error": str(exc)}), 400
+            # Make this process notice it immediately
+            self._next_check = 0.0
+            return flask.jsonify({"armed": state})
+
+        @blueprint.route("/disarm", methods=["POST"])
+        def profiling_disarm():
+            disarm(self.state_file)
+            self._next_check = 0.0
+            return flask.jsonify({"armed": None})
+
+        app.register_blueprint(blueprint)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Arm or disarm the profiling of the requests of a running app."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    arm_parser = subparsers.add_parser("arm", help="Profile the next matching requests")
+    arm_parser.add_argument("state_file", help="e.g. webservice/state/profiling.json")
+    arm_parser.add_argument("--count", type=int, default=1)
+    arm_parser.add_argument("--mode", choices=[CPROFILE, TRACEMALLOC], default=CPROFILE)
+    arm_parser.add_argument(
+        "--route", help="An endpoint (e.g. compute.process_structure) or a path prefix"
+    )
+    arm_parser.add_argument("--fileformat", help="e.g. cif-pymatgen")
+    arm_parser.add_argument("--ttl", type=float, default=3600)
+    disarm_parser = subparsers.add_parser("disarm", help="Stop profiling")
+    disarm_parser.add_argument("state_file")
+    status_parser = subparsers.add_parser("status", help="Show the armed state")
+    status_parser.add_argument("state_file")
+    args = parser.parse_args(argv)
+
+    if args.command == "arm":
+        try:
+            arm(
+                args.state_file,
+                count=args.count,
+                mode=args.mode,
+                route=args.route,
+                fileformat=args.fileformat,
+                ttl=args.ttl,
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+    elif args.command == "disarm":
+        disarm(args.state_file)
+    print(json.dumps({"armed": read_state(args.state_file)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
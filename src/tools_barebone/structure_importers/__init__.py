@@ -1,4 +1,10 @@
+import collections
+import statistics
+import threading
+import time
+
 import ase.io
+import ase.io.formats
 from ase.data import atomic_numbers
 from pymatgen.io.cif import CifParser as PMGCifParser
 import qe_tools
@@ -9,6 +15,17 @@ class UnknownFormatError(ValueError):
     pass
 
 
+# Formats parsed with ASE, and the corresponding ASE format name
+ase_fileformats = {
+    "vasp-ase": "vasp",
+    "xsf-ase": "xsf",
+    "castep-ase": "castep-cell",
+    "pdb-ase": "proteindatabank",
+    "xyz-ase": "xyz",
+    "cif-ase": "cif",  # currently broken in ASE: https://gitlab.com/ase/ase/issues/15
+}
+
+
 atoms_num_dict = {
     "H": 1,
     "He": 2,
@@ -176,6 +193,19 @@ def tuple_from_pymatgen(pmgstructure):
     return structure_tuple
 
 
+def preload_backends():
+    """
+    Import all the modules used by the parsers.
+
+    ASE imports the module of each format only when it is first used: call this
+    to load everything in advance, e.g. in a master process before forking
+    the workers, so that the memory is shared among them.
+    """
+    for ase_format in ase_fileformats.values():
+        # Accessing the module of a format imports it
+        _ = ase.io.formats.ioformats[ase_format].module
+
+
 def get_structure_tuple(  # pylint: disable=too-many-locals
     fileobject, fileformat, extra_data=None
 ):
@@ -190,14 +220,6 @@ def get_structure_tuple(  # pylint: disable=too-many-locals
     :return: a structure tuple (cell, positions, numbers) as accepted
         by seekpath.
     """
-    ase_fileformats = {
-        "vasp-ase": "vasp",
-        "xsf-ase": "xsf",
-        "castep-ase": "castep-cell",
-        "pdb-ase": "proteindatabank",
-        "xyz-ase": "xyz",
-        "cif-ase": "cif",  # currently broken in ASE: https://gitlab.com/ase/ase/issues/15
-    }
     if fileformat in ase_fileformats.keys():
         asestructure = ase.io.read(fileobject, format=ase_fileformats[fileformat])
 
@@ -274,3 +296,136 @@ def get_structure_tuple(  # pylint: disable=too-many-locals
         return structure_tuple
 
     raise UnknownFormatError(fileformat)
+
+
+# Parsers that can read the same type of file, in their default order.
+# The format '<file type>-auto' (e.g. 'cif-auto') tries all of them.
+fallback_chains = {
+    "cif": ["cif-pymatgen", "cif-ase"],
+}
+
+
+class ParserStatistics:
+    """
+    Success rate and parse time of each parser, collected at runtime, used to
+    order the parsers of a fallback chain.
+
+    Parsers are sorted by their expected cost, i.e. their median parse time
+    divided by their success rate (this minimizes the average time spent
+    before finding a parser that works). Parsers with less than `min_samples`
+    recorded attempts are tried first, so that all of them get measured.
+
+    :param window: number of recent attempts to remember for each parser
+    :param min_samples: number of attempts needed before using the statistics
+    """
+
+    def __init__(self, window=200, min_samples=10):
+        self.window = window
+        self.min_samples = min_samples
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def record(self, fileformat, success, elapsed):
+        """Record an attempt to parse a file with the given parser.
+
+        :param fileformat: the name of the parser
+        :param success: whether parsing succeeded
+        :param elapsed: the time spent, in seconds
+        """
+        with self._lock:
+            self._attempts.setdefault(
+                fileformat, collections.deque(maxlen=self.window)
+            ).append((success, elapsed))
+
+    def get_expected_cost(self, fileformat):
+        """Return the expected cost of a parser, or None if there are not
+        enough attempts recorded yet."""
+        with self._lock:
+            attempts = list(self._attempts.get(fileformat, ()))
+        if len(attempts) < self.min_samples:
+            return None
+        successes = sum(1 for success, _ in attempts if success)
+        # Laplace smoothing, to avoid dividing by zero
+        success_rate = (successes + 1) / (len(attempts) + 2)
+        return statistics.median(elapsed for _, elapsed in attempts) / success_rate
+
+    def sort(self, fileformats):
+        """Return the parsers sorted by increasing expected cost."""
+        costs = {
+            fileformat: self.get_expected_cost(fileformat) for fileformat in fileformats
+        }
+        return sorted(
+            fileformats,
+            key=lambda fileformat: -1
+            if costs[fileformat] is None
+            else costs[fileformat],
+        )
+
+
+default_parser_statistics = ParserStatistics()
+
+
+def get_fallback_chain(fileformat, parser_statistics=default_parser_statistics):
+    """
+    Return the list of parsers to try for a given file format.
+
+    If `fileformat` is '<file type>-auto', all parsers for that file type are
+    returned, sorted using the `parser_statistics`. Otherwise, the requested
+    parser comes first, followed by the other parsers for the same file type
+    (if any), sorted using the `parser_statistics`.
+
+    :raise UnknownFormatError: if the format is '<file type>-auto' and there
+        is no fallback chain for that file type
+    """
+    if fileformat.endswith("-auto"):
+        try:
+            chain = fallback_chains[fileformat[: -len("-auto")]]
+        except KeyError:
+            raise UnknownFormatError(fileformat)
+        return parser_statistics.sort(chain)
+    for chain in fallback_chains.values():
+        if fileformat in chain:
+            return [fileformat] + parser_statistics.sort(
+                [other for other in chain if other != fileformat]
+            )
+    return [fileformat]
+
+
+def get_structure_tuple_with_fallback(
+    fileobject,
+    fileformat,
+    extra_data=None,
+    parser_statistics=default_parser_statistics,
+):
+    """
+    Same as `get_structure_tuple`, but if the parser fails, try the other
+    parsers for the same file type (see `get_fallback_chain`).
+    Success and parse time of each attempt are recorded in `parser_statistics`.
+
+    :param fileobject: a seekable file-like object containing the file content
+    :param fileformat: a string with the format to use to parse the data, or
+        '<file type>-auto' (e.g. 'cif-auto') to choose the parser automatically
+    :param parser_statistics: a `ParserStatistics` instance
+
+    :return: a tuple (structure_tuple, fileformat), where fileformat is the
+        parser that succeeded.
+    :raise UnknownFormatError: if the format is not known
+    :raise Exception: the exception raised by the last parser, if all failed
+    """
+    last_exception = None
+    for parser_format in get_fallback_chain(fileformat, parser_statistics):
+        fileobject.seek(0)
+        start = time.perf_counter()
+        try:
+            structure_tuple = get_structure_tuple(
+                fileobject, parser_format, extra_data=extra_data
+            )
+        except UnknownFormatError:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            parser_statistics.record(parser_format, False, time.perf_counter() - start)
+            last_exception = exc
+            continue
+        parser_statistics.record(parser_format, True, time.perf_counter() - start)
+        return structure_tuple, parser_format
+    raise last_exception
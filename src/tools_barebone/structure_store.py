@@ -0,0 +1,294 @@
+"""Persistent columnar store of parsed structures.
+
+Parsing large corpora of structure files (e.g. CIF files with pymatgen) is
+slow, and when the same corpus is processed repeatedly most of the time is
+spent re-parsing the same text. A `StructureStore` keeps many parsed
+structures in a directory with one `.npy` file per column:
+
+- `positions.npy`: the fractional coordinates of all atoms of all
+  structures, concatenated (float64, shape (N, 3));
+- `numbers.npy`: the atomic numbers of all atoms (int16, shape (N,));
+- `cells.npy`: the cell of each structure (float64, shape (M, 3, 3));
+- `offsets.npy`: the index in the two arrays above of the first atom of
+  each structure, plus the total number of atoms (int64, shape (M + 1,));
+- `keys.npy`: a key (e.g. a content hash) for each structure (S64, shape (M,)).
+
+The files are opened with `np.load(..., mmap_mode='r')`, so fetching a
+structure only slices the memory maps: nothing is read from disk until
+the data is used, and only the pages that are needed.
+
+New structures can be appended: the data is written at the end of each
+file, then the shape in the `.npy` headers is updated, `offsets.npy`
+last. Readers therefore always see a consistent set of structures, and an
+interrupted append is discarded by the next one. Appends from different
+processes are serialized with a lock file.
+
+Usage::
+
+    store = StructureStore("corpus.store")
+    for path in paths:
+        with open(path) as fileobject:
+            structure_tuple = store.get_or_parse(fileobject, "cif-pymatgen")
+
+or, from the command line::
+
+    python -m tools_barebone.structure_store corpus.store --format cif-pymatgen *.cif
+"""
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from .structure_importers import get_structure_tuple
+
+# Fixed size of the .npy headers, so that the shape can be rewritten in place
+HEADER_SIZE = 128
+
+KEY_LENGTH = 64
+
+COLUMNS = {
+    "positions": (np.dtype("<f8"), (3,)),
+    "numbers": (np.dtype("<i2"), ()),
+    "cells": (np.dtype("<f8"), (3, 3)),
+    "offsets": (np.dtype("<i8"), ()),
+    "keys": (np.dtype("S{}".format(KEY_LENGTH)), ()),
+}
+
+
+def get_content_hash(content, fileformat, extra_data=None):
+    """Return a key identifying the result of parsing a file.
+
+    :param content: the content of the file, as a string or bytes
+    :param fileformat: the format used to parse the file
+    :param extra_data: the extra data passed to the parser, if any
+        (e.g. the cell for XYZ files)
+
+    :return: the hexadecimal SHA-256 of format, extra data and content
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    hasher = hashlib.sha256()
+    hasher.update(fileformat.encode("utf-8") + b"\0")
+    if extra_data is not None:
+        hasher.update(json.dumps(extra_data, sort_keys=True).encode("utf-8"))
+    hasher.update(b"\0" + content)
+    return hasher.hexdigest()
+
+
+def _write_header(fhandle, dtype, shape):
+    """Write a version 1.0 .npy header of exactly HEADER_SIZE bytes."""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(dtype), tuple(shape)
+    )
+    # magic string (6 bytes), version (2 bytes), header length (2 bytes)
+    header_length = HEADER_SIZE - 10
+    if len(header) + 1 > header_length:
+        raise ValueError("The shape {} does not fit in the header".format(shape))
+    fhandle.seek(0)
+    fhandle.write(np.lib.format.magic(1, 0))
+    fhandle.write(header_length.to_bytes(2, "little"))
+    fhandle.write(header.ljust(header_length - 1).encode("latin1") + b"\n")
+
+
+class StructureStore:
+    """A directory of memory-mapped columns with many parsed structures.
+
+    :param path: the directory of the store (created if missing)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Committed keys never change: the index is only extended
+        self._keys_index = {}
+        self._num_indexed = 0
+        os.makedirs(path, exist_ok=True)
+        with self._lock():
+            for name, (dtype, row_shape) in COLUMNS.items():
+                filename = self._get_filename(name)
+                if not os.path.exists(filename):
+                    with open(filename + ".tmp", "wb") as fhandle:
+                        length = 1 if name == "offsets" else 0
+                        _write_header(fhandle, dtype, (length,) + row_shape)
+                        if name == "offsets":
+                            fhandle.write(np.zeros(1, dtype=dtype).tobytes())
+                    os.replace(filename + ".tmp", filename)
+        self.reload()
+
+    def _get_filename(self, name):
+        return os.path.join(self.path, name + ".npy")
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def reload(self):
+        """Map the files again, to see the structures appended by others."""
+        # offsets first: the other columns are at least as long
+        self._offsets = np.load(self._get_filename("offsets"), mmap_mode="r")
+        self._columns = {
+            name: np.load(self._get_filename(name), mmap_mode="r")
+            for name in COLUMNS
+            if name != "offsets"
+        }
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def get(self, index):
+        """Return the structure with the given index.
+
+        :return: a structure tuple (cell, positions, numbers) of read-only
+            NumPy arrays backed by the memory maps (copy them if they must
+            outlive the store)
+        :raise IndexError: if there is no such structure
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError("Structure index {} out of range".format(index))
+        index %= len(self)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return (
+            self._columns["cells"][index],
+            self._columns["positions"][start:end],
+            self._columns["numbers"][start:end],
+        )
+
+    def get_index(self, key):
+        """Return the index of the last structure stored with a key, or None."""
+        if self._num_indexed < len(self):
+            # Read the keys column only once, then only the new keys
+            new_keys = self._columns["keys"][self._num_indexed : len(self)]
+            self._keys_index.update(
+                (stored_key, index)
+                for index, stored_key in enumerate(
+                    new_keys.tolist(), start=self._num_indexed
+                )
+            )
+            self._num_indexed = len(self)
+        return self._keys_index.get(key.encode("ascii"))
+
+    def get_by_key(self, key):
+        """Return the structure stored with a key (see `get`), or None."""
+        index = self.get_index(key)
+        if index is None:
+            return None
+        return self.get(index)
+
+    def append(self, structure_tuples_with_keys):
+        """Append structures to the store.
+
+        :param structure_tuples_with_keys: an iterable of
+            (structure_tuple, key) pairs, where key is a string of at most
+            64 ASCII characters (e.g. from `get_content_hash`)
+        :return: the indices of the new structures
+        """
+        cells, positions, numbers, keys = [], [], [], []
+        for structure_tuple, key in structure_tuples_with_keys:
+            cell, structure_positions, structure_numbers = structure_tuple
+            structure_positions = np.asarray(structure_positions, dtype=float)
+            structure_numbers = np.asarray(structure_numbers)
+            if structure_positions.size != 3 * len(structure_numbers):
+                raise ValueError("Inconsistent positions and atomic numbers")
+            encoded_key = key.encode("ascii")
+            if len(encoded_key) > KEY_LENGTH:
+                raise ValueError("Keys can be at most {} characters".format(KEY_LENGTH))
+            cells.append(np.asarray(cell, dtype=float).reshape(3, 3))
+            positions.append(structure_positions.reshape(-1, 3))
+            numbers.append(structure_numbers)
+            keys.append(encoded_key)
+
+        with self._lock():
+            offsets = np.load(self._get_filename("offsets"), mmap_mode="r")
+            num_structures = len(offsets) - 1
+            num_atoms = int(offsets[-1])
+            del offsets
+            self._append_column("keys", num_structures, keys)
+            self._append_column("cells", num_structures, cells)
+            self._append_column("numbers", num_atoms, numbers, concatenate=True)
+            self._append_column("positions", num_atoms, positions, concatenate=True)
+            # Last: this makes the new structures visible to readers
+            self._append_column(
+                "offsets",
+                num_structures + 1,
+                num_atoms + np.cumsum([len(item) for item in numbers], dtype=int),
+            )
+        self.reload()
+        return list(range(num_structures, num_structures + len(keys)))
+
+    def _append_column(self, name, num_rows, rows, concatenate=False):
+        """Write rows after the first `num_rows` rows of a column (dropping
+        any leftover of an interrupted append), and update its header."""
+        dtype, row_shape = COLUMNS[name]
+        if concatenate:
+            rows = np.concatenate(rows) if rows else []
+        rows = np.asarray(rows, dtype=dtype).reshape((-1,) + row_shape)
+        row_size = dtype.itemsize * int(np.prod(row_shape, dtype=int))
+        with open(self._get_filename(name), "r+b") as fhandle:
+            fhandle.truncate(HEADER_SIZE + num_rows * row_size)
+            fhandle.seek(0, os.SEEK_END)
+            fhandle.write(rows.tobytes())
+            fhandle.flush()
+            _write_header(fhandle, dtype, (num_rows + len(rows),) + row_shape)
+
+    def get_or_parse(self, fileobject, fileformat, extra_data=None):
+        """Return the structure in a file, parsing it with
+        `get_structure_tuple` and storing it only if it is not in the store.
+
+        The structure is looked up by the hash of the file content, the
+        format and the extra data (see `get_content_hash`).
+
+        :return: a structure tuple of NumPy arrays (see `get`)
+        """
+        key = get_content_hash(fileobject.read(), fileformat, extra_data)
+        structure_tuple = self.get_by_key(key)
+        if structure_tuple is None:
+            self.reload()
+            structure_tuple = self.get_by_key(key)
+        if structure_tuple is None:
+            fileobject.seek(0)
+            structure_tuple = get_structure_tuple(
+                fileobject, fileformat, extra_data=extra_data
+            )
+            index = self.append([(structure_tuple, key)])[0]
+            structure_tuple = self.get(index)
+        return structure_tuple
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Parse structure files and add them to a structure store."
+    )
+    parser.add_argument("store", help="The directory of the store")
+    parser.add_argument("files", nargs="+", help="The files to parse")
+    parser.add_argument(
+        "--format", required=True, help="The parser to use, e.g. cif-pymatgen"
+    )
+    args = parser.parse_args(argv)
+
+    store = StructureStore(args.store)
+    failed = 0
+    for path in args.files:
+        try:
+            with open(path) as fileobject:
+                store.get_or_parse(fileobject, args.format)
+        except Exception as exc:  # pylint: disable=broad-except
+            failed += 1
+            print("{}: {}".format(path, exc), file=sys.stderr)
+    print(
+        "{} structures in the store, {} files failed".format(len(store), failed),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
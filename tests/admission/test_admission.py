@@ -0,0 +1,160 @@
+import threading
+
+import flask
+import pytest
+
+from tools_barebone.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    ConcurrencyLimiter,
+    TokenBucketStore,
+)
+
+
+def test_concurrency_limiter_bounded_queue():
+    """Requests beyond the running and queued ones are rejected with a 503."""
+    limiter = ConcurrencyLimiter(
+        max_concurrent=1, max_queued=1, queue_timeout=5, retry_after=3
+    )
+    limiter.acquire()
+
+    admitted = threading.Event()
+
+    def queued_request():
+        limiter.acquire()
+        admitted.set()
+        limiter.release()
+
+    waiter = threading.Thread(target=queued_request)
+    waiter.start()
+    # Wait until the second request is in the queue
+    while limiter._waiting == 0:  # pylint: disable=protected-access
+        pass
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.retry_after == 3
+
+    limiter.release()
+    waiter.join()
+    assert admitted.is_set()
+
+
+def test_concurrency_limiter_timeout():
+    """A request waiting longer than the queue timeout is rejected."""
+    limiter = ConcurrencyLimiter(
+        max_concurrent=1, max_queued=1, queue_timeout=0.01, retry_after=1
+    )
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire()
+
+
+def test_token_bucket_shared_state(tmp_path):
+    """The buckets are per client and shared via the state file."""
+    path = str(tmp_path / "state.sqlite")
+    buckets = TokenBucketStore(path, rate=0.001, burst=2)
+    assert buckets.consume("1.2.3.4") == 0
+    assert buckets.consume("1.2.3.4") == 0
+    assert buckets.consume("1.2.3.4") > 0
+    assert buckets.consume("5.6.7.8") == 0
+
+    # A second store on the same file (e.g. in another process) sees the state
+    other_buckets = TokenBucketStore(path, rate=0.001, burst=2)
+    assert other_buckets.consume("1.2.3.4") > 0
+
+
+def test_init_app(tmp_path):
+    """Only the views of the given blueprints are limited."""
+    app = flask.Flask(__name__)
+    blueprint = flask.Blueprint("compute", __name__, url_prefix="/compute")
+
+    @app.route("/")
+    def index():
+        return "index"
+
+    @blueprint.route("/process/")
+    def process():
+        return "processed"
+
+    app.register_blueprint(blueprint)
+    AdmissionController.from_config(
+        {"rate_limit_per_minute": 0.06, "rate_limit_burst": 1},
+        default_state_file=str(tmp_path / "state.sqlite"),
+    ).init_app(app)
+
+    client = app.test_client()
+    headers = {"X-Forwarded-For": "1.2.3.4"}
+    assert client.get("/compute/process/", headers=headers).status_code == 200
+    response = client.get("/compute/process/", headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert client.get("/", headers=headers).status_code == 200
+
+
+def test_init_app_forged_forwarded_for(tmp_path):
+    """Clients cannot get a new bucket by sending their own X-Forwarded-For:
+    only the entry appended by the reverse proxy identifies them."""
+    app = flask.Flask(__name__)
+    blueprint = flask.Blueprint("compute", __name__, url_prefix="/compute")
+
+    @blueprint.route("/process/")
+    def process():
+        return "processed"
+
+    app.register_blueprint(blueprint)
+    AdmissionController.from_config(
+        {"rate_limit_per_minute": 0.06, "rate_limit_burst": 1},
+        default_state_file=str(tmp_path / "state.sqlite"),
+    ).init_app(app)
+
+    client = app.test_client()
+    headers = {"X-Forwarded-For": "10.0.0.1, 1.2.3.4"}
+    assert client.get("/compute/process/", headers=headers).status_code == 200
+    headers = {"X-Forwarded-For": "10.0.0.2, 1.2.3.4"}
+    assert client.get("/compute/process/", headers=headers).status_code == 429
+
+
+def test_busy_rejection_refunds_token(tmp_path):
+    """A request rejected with a 503 does not consume a token."""
+    controller = AdmissionController(
+        limiter=ConcurrencyLimiter(
+            max_concurrent=1, max_queued=0, queue_timeout=0, retry_after=1
+        ),
+        buckets=TokenBucketStore(str(tmp_path / "state.sqlite"), rate=0.001, burst=2),
+    )
+    controller.enter("1.2.3.4")
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.enter("1.2.3.4")
+    assert excinfo.value.status_code == 503
+    controller.leave()
+    # One token left: the rejected request gave its token back
+    controller.enter("1.2.3.4")
+    controller.leave()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.enter("1.2.3.4")
+    assert excinfo.value.status_code == 429
+
+
+def test_trusted_proxies(tmp_path):
+    """Behind two proxies, the client is the second-to-last entry."""
+    app = flask.Flask(__name__)
+    blueprint = flask.Blueprint("compute", __name__, url_prefix="/compute")
+
+    @blueprint.route("/process/")
+    def process():
+        return "processed"
+
+    app.register_blueprint(blueprint)
+    AdmissionController.from_config(
+        {"rate_limit_per_minute": 0.06, "rate_limit_burst": 1, "trusted_proxies": 2},
+        default_state_file=str(tmp_path / "state.sqlite"),
+    ).init_app(app)
+
+    client = app.test_client()
+    for address in ["1.2.3.4", "5.6.7.8"]:
+        headers = {"X-Forwarded-For": "10.0.0.1, {}, 192.168.0.1".format(address)}
+        assert client.get("/compute/process/", headers=headers).status_code == 200
+    headers = {"X-Forwarded-For": "10.0.0.2, 1.2.3.4, 192.168.0.1"}
+    assert client.get("/compute/process/", headers=headers).status_code == 429
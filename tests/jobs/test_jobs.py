@@ -0,0 +1,116 @@
+import time
+
+import flask
+
+from tools_barebone.jobs import (
+    JobQueue,
+    JobStore,
+    background_job,
+    job_accepted_response,
+)
+
+
+@background_job
+def add(first, second):
+    """Example job."""
+    return {"sum": first + second, "app": flask.current_app.name}
+
+
+@background_job
+def fail():
+    """Example job that fails."""
+    raise ValueError
+
+
+@background_job
+def unserializable():
+    """Example job whose result is not JSON-serializable."""
+    return {"x": object()}
+
+
+def get_app(tmp_path):
+    """Create an app with a job queue and routes that submit jobs."""
+    app = flask.Flask("jobs_test_app")
+
+    @app.route("/add/<int:first>/<int:second>/", methods=["POST"])
+    def submit_add(first, second):
+        return job_accepted_response(add.submit(first, second))
+
+    @app.route("/fail/", methods=["POST"])
+    def submit_fail():
+        return job_accepted_response(fail.submit())
+
+    @app.route("/unserializable/", methods=["POST"])
+    def submit_unserializable():
+        return job_accepted_response(unserializable.submit())
+
+    JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), max_workers=2).init_app(app)
+    return app
+
+
+def wait_for_job(client, status_url):
+    """Poll the status endpoint until the job is finished."""
+    for _ in range(500):
+        job = client.get(status_url).get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("The job did not finish")
+
+
+def test_submit_and_poll(tmp_path):
+    """A submitted job runs in the app context and its result can be polled."""
+    app = get_app(tmp_path)
+    client = app.test_client()
+    response = client.post("/add/1/2/")
+    assert response.status_code == 202
+    status_url = response.get_json()["status_url"]
+    assert response.headers["Location"] == status_url
+
+    job = wait_for_job(client, status_url)
+    assert job["status"] == "done"
+    assert job["result"] == {"sum": 3, "app": "jobs_test_app"}
+    assert job["error"] is None
+
+    # Direct calls still work
+    with app.app_context():
+        assert add(2, 3)["sum"] == 5
+
+
+def test_failed_job(tmp_path):
+    """A job raising an exception is reported as failed."""
+    client = get_app(tmp_path).test_client()
+    job = wait_for_job(client, client.post("/fail/").get_json()["status_url"])
+    assert job["status"] == "failed"
+    assert job["result"] is None
+
+
+def test_unserializable_result(tmp_path):
+    """A job whose result cannot be stored is reported as failed."""
+    client = get_app(tmp_path).test_client()
+    status_url = client.post("/unserializable/").get_json()["status_url"]
+    job = wait_for_job(client, status_url)
+    assert job["status"] == "failed"
+    assert job["result"] is None
+
+
+def test_unknown_and_expired_jobs(tmp_path):
+    """Unknown and expired jobs give a 404."""
+    client = get_app(tmp_path).test_client()
+    assert client.get("/jobs/nonexistent/").status_code == 404
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.create("expired", ttl=-1)
+    assert store.get("expired") is None
+    store.purge_expired()
+    assert client.get("/jobs/expired/").status_code == 404
+
+
+def test_interrupted_job(tmp_path):
+    """A job owned by a process that does not exist anymore is failed."""
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.create("interrupted", ttl=100)
+    with store._get_connection() as connection:  # pylint: disable=protected-access
+        # PIDs are always smaller than 2**22 on Linux
+        connection.execute("UPDATE jobs SET owner = ?", (2**30,))
+    assert store.get("interrupted")["status"] == "failed"
@@ -0,0 +1,93 @@
+import gzip
+import json
+import os
+
+from tools_barebone.log_analysis import (
+    analyze,
+    format_report,
+    get_bucket_upper_bound,
+    get_size_bucket,
+    main,
+)
+
+
+def log_line(fileformat, filecontent, reason, source):
+    """Return a log line as written by logme."""
+    logdict = {
+        "data": {"filecontent": filecontent, "fileformat": fileformat},
+        "reason": reason,
+        "source": source,
+    }
+    return "[2024-01-01 00:00:00,000]DEBUG-process_structure ^ {}\n".format(
+        json.dumps(logdict)
+    )
+
+
+def test_size_buckets():
+    """The upper bound of the bucket of a size is never smaller than the size."""
+    for size in range(10000):
+        assert get_bucket_upper_bound(get_size_bucket(size)) >= size
+        assert get_bucket_upper_bound(get_size_bucket(size) - 1) < size
+
+
+def test_incremental_analysis(tmp_path):
+    """Rotated, gzipped and current logs are processed once each."""
+    log_path = str(tmp_path / "requests.log")
+    with gzip.open(log_path + ".2024-01-01.gz", "wt") as fhandle:
+        fhandle.write(log_line("cif-ase", "a" * 100, "exception", "1.1.1.1"))
+    with open(log_path + ".2024-01-02", "w") as fhandle:
+        fhandle.write(log_line("cif-pymatgen", "b" * 10, "OK", "2.2.2.2"))
+        fhandle.write("not a JSON log line\n")
+    os.utime(log_path + ".2024-01-01.gz", (0, 0))
+    with open(log_path, "w") as fhandle:
+        fhandle.write(log_line("cif-ase", "c" * 1000, "OK", "1.1.1.1"))
+        # Incomplete line, being written
+        fhandle.write(log_line("xyz-ase", "d", "OK", "3.3.3.3")[:20])
+
+    state = analyze(log_path)
+    stats = state["stats"]
+    assert stats["lines"] == 4
+    assert stats["malformed_lines"] == 1
+    assert stats["formats"]["cif-ase"]["reasons"] == {"exception": 1, "OK": 1}
+    assert stats["formats"]["cif-ase"]["bytes"] == 1100
+    assert stats["clients"]["1.1.1.1"] == {"requests": 2, "bytes": 1100}
+
+    # Complete the line, then rotate and compress the current log
+    with open(log_path, "a") as fhandle:
+        fhandle.write(log_line("xyz-ase", "d", "OK", "3.3.3.3")[20:])
+    with open(log_path, "rb") as source, gzip.open(
+        log_path + ".2024-01-03.gz", "wb"
+    ) as dest:
+        dest.write(source.read())
+    with open(log_path, "w") as fhandle:
+        fhandle.write(log_line("xyz-ase", "e" * 5, "unknownformat", "3.3.3.3"))
+
+    # Save and reload the state, as done between runs of the command
+    state = analyze(log_path, json.loads(json.dumps(state)))
+    stats = state["stats"]
+    assert stats["lines"] == 6
+    assert stats["formats"]["xyz-ase"]["requests"] == 2
+    assert stats["clients"]["3.3.3.3"] == {"requests": 2, "bytes": 6}
+
+    report = format_report(stats)
+    assert "cif-ase" in report
+    assert "unknownformat: 1" in report
+
+
+def test_main(tmp_path, capsys):
+    """The command saves its state and only processes new lines."""
+    log_path = str(tmp_path / "requests.log")
+    with open(log_path, "w") as fhandle:
+        fhandle.write(log_line("cif-ase", "a" * 100, "OK", "1.1.1.1"))
+
+    main([log_path, "--json"])
+    assert json.loads(capsys.readouterr().out)["lines"] == 1
+    assert os.path.exists(str(tmp_path / "requests-analysis.json"))
+
+    with open(log_path, "a") as fhandle:
+        fhandle.write(log_line("cif-ase", "a" * 100, "OK", "1.1.1.1"))
+    main([log_path, "--json"])
+    assert json.loads(capsys.readouterr().out)["lines"] == 2
+
+    main([log_path, "--reset"])
+    assert "Processed 2 lines" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from tools_barebone.neighbors import (
+    find_duplicate_atoms,
+    get_bonds,
+    get_neighbor_pairs,
+    merge_duplicate_atoms,
+)
+
+
+def get_pairs_brute_force(cell, positions, cutoff, max_shift=6):
+    """Return the set of (first, second, shift) pairs, by checking all images."""
+    cell = np.asarray(cell)
+    positions = np.asarray(positions)
+    pairs = set()
+    for first, second in itertools.product(range(len(positions)), repeat=2):
+        for shift in itertools.product(range(-max_shift, max_shift + 1), repeat=3):
+            if first == second and shift == (0, 0, 0):
+                continue
+            vector = (positions[second] + shift - positions[first]) @ cell
+            if np.linalg.norm(vector) <= cutoff:
+                pairs.add((first, second, shift))
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_neighbor_pairs(seed):
+    """Compare with a brute-force search, for skewed cells, atoms outside the
+    cell and cutoffs larger than the cell."""
+    rng = np.random.default_rng(seed)
+    cell = np.eye(3) * rng.uniform(2, 5) + rng.uniform(-1, 1, (3, 3))
+    positions = rng.uniform(-1, 2, (5, 3))
+    cutoff = rng.uniform(1, 5)
+
+    first, second, shifts, distances = get_neighbor_pairs(cell, positions, cutoff)
+    pairs = set()
+    for atom_first, atom_second, shift in zip(first, second, shifts):
+        pairs.add((atom_first, atom_second, tuple(shift)))
+        pairs.add((atom_second, atom_first, tuple(-shift)))
+    # Each pair is returned only once
+    assert len(pairs) == 2 * len(first)
+    assert pairs == get_pairs_brute_force(cell, positions, cutoff)
+    np.testing.assert_allclose(
+        distances,
+        np.linalg.norm((positions[second] + shifts - positions[first]) @ cell, axis=1),
+    )
+
+
+def test_singular_cell():
+    """A singular cell cannot be periodic."""
+    with pytest.raises(ValueError):
+        get_neighbor_pairs(np.zeros((3, 3)), [[0, 0, 0]], 1.0)
+
+
+def test_expensive_searches():
+    """Searches whose cost would be unbounded are rejected."""
+    # A cell far smaller than the cutoff (e.g. a crafted POSCAR file)
+    with pytest.raises(ValueError):
+        get_bonds((np.eye(3) * 0.01, [[0, 0, 0]], [55]))
+    # Many atoms in a small volume
+    positions = np.random.default_rng(0).uniform(0, 1, (2000, 3))
+    with pytest.raises(ValueError):
+        get_neighbor_pairs(np.eye(3) * 5, positions, 4.0)
+
+
+def test_duplicates_and_bonds():
+    """Duplicated atoms are found and merged; bonds are computed."""
+    # Diamond silicon (conventional cell)
+    cell = np.eye(3) * 5.43
+    fcc = [[0, 0, 0], [0, 0.5, 0.5], [0.5, 0, 0.5], [0.5, 0.5, 0]]
+    positions = fcc + [[x + 0.25, y + 0.25, z + 0.25] for x, y, z in fcc]
+    numbers = [14] * 8
+    structure_tuple = (cell.tolist(), positions, numbers)
+
+    assert not find_duplicate_atoms(structure_tuple)
+    bonds = get_bonds(structure_tuple)
+    # Four bonds per atom, each counted once
+    assert len(bonds) == 16
+
+    # Duplicate two atoms, one of them twice and in another image
+    duplicated = (
+        cell.tolist(),
+        positions + [[0.001, 0, 0], [1.0, 0.0, 0.0], [0.75, 0.75, 0.251]],
+        numbers + [14, 14, 14],
+    )
+    assert len(find_duplicate_atoms(duplicated)) == 4
+    merged = merge_duplicate_atoms(duplicated)
+    assert merged[1] == positions
+    assert merged[2] == numbers
+
+    # Overlapping atoms of different elements are not merged
+    different = (cell.tolist(), positions + [[0.001, 0, 0]], numbers + [8])
+    assert len(merge_duplicate_atoms(different)[2]) == 9
@@ -0,0 +1,127 @@
+import cProfile
+import json
+import os
+import pstats
+
+import flask
+
+from tools_barebone import profiling
+from tools_barebone.profiling import RequestProfiler, arm, read_state
+
+KEY = "0123456789abcdef"
+
+
+def get_app(tmp_path):
+    app = flask.Flask(__name__)
+    profiler = RequestProfiler(
+        state_file=str(tmp_path / "profiling.json"),
+        output_folder=str(tmp_path / "profiles"),
+        key=KEY,
+        check_interval=0.0,
+    )
+    profiler.init_app(app)
+
+    @app.route("/compute/", methods=["POST"])
+    def compute():
+        return str(sum(range(1000)))
+
+    return app
+
+
+def get_captures(tmp_path):
+    """Return the metadata of the captured requests."""
+    folder = tmp_path / "profiles"
+    if not folder.exists():
+        return []
+    return [
+        json.loads((folder / name).read_text())
+        for name in sorted(os.listdir(str(folder)))
+        if name.endswith(".json")
+    ]
+
+
+def test_arm_via_http(tmp_path):
+    """Profiling is armed with the key, and disarms itself after N requests."""
+    client = get_app(tmp_path).test_client()
+    assert client.post("/profiling/arm", data={"count": 2}).status_code == 403
+    response = client.post(
+        "/profiling/arm",
+        data={"count": 2, "fileformat": "cif-ase"},
+        headers={"X-Profiling-Key": KEY},
+    )
+    assert response.status_code == 200
+
+    for fileformat in ["xsf-ase", "cif-ase", "cif-ase", "cif-ase"]:
+        client.post("/compute/", data={"fileformat": fileformat})
+
+    captures = get_captures(tmp_path)
+    assert [capture["fileformat"] for capture in captures] == ["cif-ase"] * 2
+    assert captures[0]["endpoint"] == "compute"
+    assert captures[0]["status_code"] == 200
+    assert captures[0]["content_length"] > 0
+    profile_file = [
+        name
+        for name in os.listdir(str(tmp_path / "profiles"))
+        if name.endswith(".prof")
+    ][0]
+    pstats.Stats(str(tmp_path / "profiles" / profile_file))
+    assert read_state(str(tmp_path / "profiling.json")) is None
+
+
+def test_tracemalloc(tmp_path):
+    """Memory allocations can be captured, for a given route."""
+    client = get_app(tmp_path).test_client()
+    arm(str(tmp_path / "profiling.json"), 1, mode="tracemalloc", route="/compute/")
+    client.post("/compute/")
+    client.post("/compute/")
+
+    captures = get_captures(tmp_path)
+    assert len(captures) == 1
+    assert captures[0]["peak_memory"] > 0
+
+
+def test_profiler_failure(tmp_path, monkeypatch):
+    """A profiler that cannot start does not affect the request, nor block
+    the next captures."""
+    app = get_app(tmp_path)
+    client = app.test_client()
+    arm(str(tmp_path / "profiling.json"), 2)
+
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(cProfile.Profile, "enable", enable)
+        assert client.post("/compute/").status_code == 200
+    assert client.post("/compute/").status_code == 200
+    assert len(get_captures(tmp_path)) == 1
+
+
+def test_unwritable_state_file(tmp_path, monkeypatch):
+    """A state file that cannot be modified (e.g. written by root) does not
+    affect the requests."""
+    app = get_app(tmp_path)
+    client = app.test_client()
+    state_file = str(tmp_path / "profiling.json")
+    arm(state_file, 2)
+
+    real_open = open
+
+    def open_read_only(path, mode="r", *args, **kwargs):
+        if path == state_file and mode == "r+":
+            raise PermissionError(13, "Permission denied", path)
+        return real_open(path, mode, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr("builtins.open", open_read_only)
+        assert client.post("/compute/").status_code == 200
+    assert get_captures(tmp_path) == []
+
+    # A failure after the capture lock was taken releases it
+    arm(state_file, 1)
+    with monkeypatch.context() as patch:
+        patch.setattr(profiling, "disarm", lambda state_file: 1 / 0)
+        assert client.post("/compute/").status_code == 200
+    arm(state_file, 1)
+    assert client.post("/compute/").status_code == 200
+    assert len(get_captures(tmp_path)) == 1
@@ -0,0 +1,87 @@
+import io
+import os
+
+import pytest
+
+from tools_barebone.structure_importers import (
+    ParserStatistics,
+    UnknownFormatError,
+    get_fallback_chain,
+    get_structure_tuple_with_fallback,
+)
+
+STRUCTURE_EXAMPLES_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "structure_examples"
+)
+
+
+def get_fileobject(*relpath):
+    """Return a StringIO with the content of a structure example."""
+    with open(os.path.join(STRUCTURE_EXAMPLES_PATH, *relpath)) as fhandle:
+        return io.StringIO(fhandle.read())
+
+
+def test_fallback_chain_order():
+    """The requested parser comes first; the others are sorted by expected cost."""
+    parser_statistics = ParserStatistics(min_samples=2)
+    assert get_fallback_chain("xsf-ase", parser_statistics) == ["xsf-ase"]
+    assert get_fallback_chain("cif-ase", parser_statistics) == [
+        "cif-ase",
+        "cif-pymatgen",
+    ]
+    # Without statistics, the default order is used
+    assert get_fallback_chain("cif-auto", parser_statistics) == [
+        "cif-pymatgen",
+        "cif-ase",
+    ]
+
+    for _ in range(2):
+        parser_statistics.record("cif-pymatgen", True, 0.1)
+        parser_statistics.record("cif-ase", True, 0.01)
+    assert get_fallback_chain("cif-auto", parser_statistics) == [
+        "cif-ase",
+        "cif-pymatgen",
+    ]
+
+    # A cheap parser that always fails ends up last
+    for _ in range(50):
+        parser_statistics.record("cif-ase", False, 0.01)
+    assert get_fallback_chain("cif-auto", parser_statistics) == [
+        "cif-pymatgen",
+        "cif-ase",
+    ]
+
+    with pytest.raises(UnknownFormatError):
+        get_fallback_chain("xyz-auto", parser_statistics)
+
+
+def test_fallback_parsing():
+    """If the requested parser fails, the next one is used and reported."""
+    parser_statistics = ParserStatistics(min_samples=1)
+    structure_tuple, parser_format = get_structure_tuple_with_fallback(
+        get_fileobject("valid", "cif-ase", "1011169.cif"),
+        "cif-auto",
+        parser_statistics=parser_statistics,
+    )
+    assert parser_format == "cif-pymatgen"
+    assert len(structure_tuple[2]) == len(structure_tuple[1])
+
+    # Simulate a parser that always fails, on a file that it would parse
+    for _ in range(5):
+        parser_statistics.record("cif-ase", False, 0.0)
+    _, parser_format = get_structure_tuple_with_fallback(
+        get_fileobject("valid", "cif-ase", "1011169.cif"),
+        "cif-pymatgen",
+        parser_statistics=parser_statistics,
+    )
+    assert parser_format == "cif-pymatgen"
+
+    # All parsers of the chain fail: the last exception is raised
+    with pytest.raises(Exception):
+        get_structure_tuple_with_fallback(
+            get_fileobject("failing", "cif-pymatgen", "bto.xsf"),
+            "cif-pymatgen",
+            parser_statistics=parser_statistics,
+        )
+    with pytest.raises(UnknownFormatError):
+        get_structure_tuple_with_fallback(io.StringIO(""), "unknown")
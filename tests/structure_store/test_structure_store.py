@@ -0,0 +1,84 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from tools_barebone.structure_store import StructureStore, get_content_hash
+
+SILICON_XSF = """CRYSTAL
+PRIMVEC
+  0.0 2.715 2.715
+  2.715 0.0 2.715
+  2.715 2.715 0.0
+PRIMCOORD
+2 1
+Si 0.0 0.0 0.0
+Si 1.3575 1.3575 1.3575
+"""
+
+
+def get_random_structure(rng, num_atoms):
+    return (
+        rng.uniform(-5, 5, (3, 3)).tolist(),
+        rng.uniform(0, 1, (num_atoms, 3)).tolist(),
+        rng.integers(1, 100, num_atoms).tolist(),
+    )
+
+
+def test_append_and_get(tmp_path):
+    """Structures can be appended and read back, also by another reader."""
+    rng = np.random.default_rng(0)
+    structures = [get_random_structure(rng, num_atoms) for num_atoms in [3, 0, 7]]
+    store = StructureStore(str(tmp_path / "store"))
+    assert len(store) == 0
+    assert store.append([(structures[0], "a"), (structures[1], "b")]) == [0, 1]
+
+    reader = StructureStore(str(tmp_path / "store"))
+    assert store.append([(structures[2], "c")]) == [2]
+    assert len(reader) == 2
+    reader.reload()
+    assert len(reader) == 3
+
+    for index, key in enumerate("abc"):
+        for structure_tuple in [reader.get(index), reader.get_by_key(key)]:
+            for stored, original in zip(structure_tuple, structures[index]):
+                np.testing.assert_array_equal(
+                    stored, np.asarray(original).reshape(stored.shape)
+                )
+    assert reader.get_by_key("d") is None
+    with pytest.raises(IndexError):
+        reader.get(3)
+
+    # The columns are valid .npy files
+    assert np.load(str(tmp_path / "store" / "numbers.npy")).shape == (10,)
+
+
+def test_interrupted_append(tmp_path):
+    """Data written by an append that did not complete is discarded."""
+    rng = np.random.default_rng(1)
+    store = StructureStore(str(tmp_path))
+    store.append([(get_random_structure(rng, 2), "a")])
+    with open(os.path.join(str(tmp_path), "positions.npy"), "ab") as fhandle:
+        fhandle.write(b"\1" * 24 * 5)
+    store.append([(get_random_structure(rng, 4), "b")])
+    assert np.load(str(tmp_path / "positions.npy")).shape == (6, 3)
+    assert len(store.get_by_key("b")[1]) == 4
+
+
+def test_get_or_parse(tmp_path, monkeypatch):
+    """A file is parsed only the first time."""
+    store = StructureStore(str(tmp_path))
+    cell, positions, numbers = store.get_or_parse(io.StringIO(SILICON_XSF), "xsf-ase")
+    np.testing.assert_allclose(positions, [[0, 0, 0], [0.25, 0.25, 0.25]])
+    assert numbers.tolist() == [14, 14]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The file should not be parsed again")
+
+    monkeypatch.setattr("tools_barebone.structure_store.get_structure_tuple", fail)
+    cached_cell = store.get_or_parse(io.StringIO(SILICON_XSF), "xsf-ase")[0]
+    np.testing.assert_array_equal(cached_cell, cell)
+    assert get_content_hash(SILICON_XSF, "xsf-ase") != get_content_hash(
+        SILICON_XSF, "xsf-ase", {"a": 1}
+    )
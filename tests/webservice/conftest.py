@@ -0,0 +1,103 @@
+"""Configuration for the tests of the modules of the webservice folder.
+
+The webservice folder is added to `sys.path`, as its modules import each
+other as top-level modules (as in the docker container).
+"""
+import functools
+import importlib.util
+import logging
+import os
+import secrets
+import sys
+import types
+
+import flask
+import jinja2
+import pytest
+
+WEBSERVICE_FOLDER = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "webservice")
+)
+sys.path.insert(0, WEBSERVICE_FOLDER)
+
+STUB_HEADER_HTML = '<header class="mcloud-header">Materials Cloud</header>\n'
+
+
+def get_stub_header_module():
+    """Return a module standing in for the Materials Cloud `header` module."""
+    header = types.ModuleType("header")
+    header.template_vars = {
+        "css_classes": {"home": "", "discover": "", "explore": "", "work": "active"}
+    }
+    return header
+
+
+@pytest.fixture(scope="session")
+def app_factory(tmp_path_factory):
+    """Return the app_factory module, able to create apps outside the docker
+    image.
+
+    The apps get a temporary secret key, and write their state, the
+    compiled templates and the request logs in temporary folders rather
+    than in the webservice folder. If the Materials Cloud header files
+    (cloned from frontend-theme when building the image) are missing,
+    stubs are used: a `header` module, and a `header.html` template looked
+    up after the templates of the app.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        if importlib.util.find_spec("header") is None:
+            monkeypatch.setitem(sys.modules, "header", get_stub_header_module())
+
+        stub_templates = tmp_path_factory.mktemp("stub_templates")
+        (stub_templates / "header.html").write_text(STUB_HEADER_HTML)
+        create_global_jinja_loader = flask.Flask.create_global_jinja_loader
+
+        def create_global_jinja_loader_with_stubs(app):
+            return jinja2.ChoiceLoader(
+                [
+                    create_global_jinja_loader(app),
+                    jinja2.FileSystemLoader(str(stub_templates)),
+                ]
+            )
+
+        monkeypatch.setattr(
+            flask.Flask,
+            "create_global_jinja_loader",
+            create_global_jinja_loader_with_stubs,
+        )
+
+        # pylint: disable=import-outside-toplevel,import-error
+        import app_factory as app_factory_module
+
+        secret_key = secrets.token_hex(16)
+        monkeypatch.setattr(app_factory_module, "get_secret_key", lambda: secret_key)
+
+        state_folder = tmp_path_factory.mktemp("state")
+        create_app = app_factory_module.create_app
+
+        def create_app_with_temporary_state(*args, **kwargs):
+            kwargs.setdefault("state_folder", str(state_folder))
+            return create_app(*args, **kwargs)
+
+        monkeypatch.setattr(
+            app_factory_module, "create_app", create_app_with_temporary_state
+        )
+        monkeypatch.setattr(
+            app_factory_module,
+            "configure_templates",
+            functools.partial(
+                app_factory_module.configure_templates,
+                cache_folder=str(state_folder / "jinja_cache"),
+            ),
+        )
+
+        log_file = tmp_path_factory.mktemp("logs") / "requests.log"
+
+        def configure_logger():
+            logger = logging.getLogger("tools-app")
+            if not logger.handlers:
+                logger.addHandler(logging.FileHandler(str(log_file)))
+                logger.setLevel(logging.DEBUG)
+
+        monkeypatch.setattr(app_factory_module, "configure_logger", configure_logger)
+        yield app_factory_module
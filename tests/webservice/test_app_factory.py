@@ -0,0 +1,59 @@
+"""Tests for serving several tools from one process with app_factory.py.
+
+The `app_factory` fixture is defined in conftest.py.
+"""
+import pytest
+from werkzeug.test import Client
+
+
+def test_multi_tool_app(app_factory, tmp_path):
+    """Each tool is served under its prefix, with its config, templates and
+    static files."""
+    tool_folder = tmp_path / "second"
+    (tool_folder / "templates" / "user_templates").mkdir(parents=True)
+    (tool_folder / "user_static" / "css").mkdir(parents=True)
+    (tool_folder / "templates" / "user_templates" / "about.html").write_text(
+        "<p>About the second tool</p>"
+    )
+    (tool_folder / "user_static" / "css" / "custom.css").write_text("body {}")
+    (tool_folder / "config.yaml").write_text(
+        "page_title: Second tool\ntemplates:\n  about: about.html\n"
+    )
+    (tmp_path / "tools.yaml").write_text(
+        "tools:\n"
+        "  - url_prefix: /first\n"
+        "    state_folder: first/state\n"
+        "  - url_prefix: /second\n"
+        "    config_file: second/config.yaml\n"
+        "    template_folder: second/templates\n"
+        "    user_static_folder: second/user_static\n"
+        "    state_folder: second/state\n"
+    )
+    client = Client(app_factory.create_multi_tool_app(str(tmp_path / "tools.yaml")))
+    headers = {"X-App-Style": "lite", "X-Script-Name": "/tools"}
+
+    response = client.get("/second", headers=headers)
+    assert response.status_code == 308
+    assert response.headers["Location"].endswith("/tools/second/")
+
+    first = client.get("/first/", headers=headers).get_data(as_text=True)
+    second = client.get("/second/", headers=headers).get_data(as_text=True)
+    assert "Second tool" not in first
+    assert "Second tool" in second
+    assert "About the second tool" in second
+
+    response = client.get("/second/user_static/css/custom.css", headers=headers)
+    assert response.get_data(as_text=True) == "body {}"
+    assert client.get("/third/", headers=headers).status_code == 404
+
+
+def test_missing_compute_module(app_factory, tmp_path):
+    """A compute module named in the tools file must be importable."""
+    (tmp_path / "tools.yaml").write_text(
+        "tools:\n"
+        "  - url_prefix: /first\n"
+        "    compute_module: nonexistent_compute_module\n"
+        "    state_folder: first/state\n"
+    )
+    with pytest.raises(ImportError):
+        app_factory.create_multi_tool_app(str(tmp_path / "tools.yaml"))
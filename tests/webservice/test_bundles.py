@@ -0,0 +1,55 @@
+"""Tests for the bundles of the custom CSS and JS files (bundles.py)."""
+# pylint: disable=import-error
+from bundles import build_bundles, minify_css, rebase_css_urls
+
+
+def test_minify_css():
+    """Comments and whitespace are removed, except in strings."""
+    assert (
+        minify_css("/* comment */\na , b {\n  content: ' x ; y ' ;\n}\n")
+        == "a,b{content: ' x ; y ';}"
+    )
+
+
+def test_rebase_css_urls():
+    """Relative URLs still point to the same files from the bundle folder."""
+    assert rebase_css_urls(
+        "a{background: url('img/a.png')} b{background: url(data:x)}",
+        "css/custom",
+        "css/bundles",
+    ) == ("a{background: url(../custom/img/a.png)} b{background: url(data:x)}")
+
+
+def test_build_bundles(tmp_path):
+    """Files are bundled in order; lists with external files are not."""
+    static_dir = tmp_path / "static"
+    user_static_dir = tmp_path / "user_static"
+    (static_dir / "css" / "custom").mkdir(parents=True)
+    (user_static_dir / "js").mkdir(parents=True)
+    (static_dir / "css" / "custom" / "first.css").write_text("a { color: red; }")
+    (static_dir / "css" / "custom" / "second.css").write_text("b { color: blue; }")
+    (user_static_dir / "js" / "first.js").write_text("var a = 1")
+    (user_static_dir / "js" / "second.js").write_text("var b = 2;")
+    config = {
+        "custom_css_files": {"input_data": ["second.css", "first.css"]},
+        "custom_js_files": {
+            "input_data": ["user_static/js/first.js", "user_static/js/second.js"],
+            "process_data": ["https://example.com/x.js", "user_static/js/first.js"],
+        },
+    }
+
+    bundles = build_bundles(config, str(static_dir), str(user_static_dir))
+    assert set(bundles) == {
+        ("css", ("second.css", "first.css")),
+        ("js", ("user_static/js/first.js", "user_static/js/second.js")),
+    }
+    css = (
+        static_dir / "css" / "bundles" / bundles[("css", ("second.css", "first.css"))]
+    ).read_text()
+    assert css.index("b{color: blue;}") < css.index("a{color: red;}")
+    js_bundle = bundles[("js", ("user_static/js/first.js", "user_static/js/second.js"))]
+    js = (static_dir / "js" / "bundles" / js_bundle).read_text()
+    assert "var a = 1\n;" in js
+
+    # The same content gives the same bundle
+    assert build_bundles(config, str(static_dir), str(user_static_dir)) == bundles
@@ -0,0 +1,26 @@
+"""Tests for the preloading of the app before forking (prefork_server.py)."""
+import gc
+import sys
+
+
+def test_preload_and_freeze(app_factory):  # pylint: disable=unused-argument
+    """The parsers are imported and all templates are compiled into the
+    bytecode cache shared by the workers."""
+    # pylint: disable=import-outside-toplevel,import-error
+    from precompile_templates import get_template_names
+    from prefork_server import preload_and_freeze
+
+    gc_enabled = gc.isenabled()
+    app = preload_and_freeze(freeze=False)
+    assert gc.isenabled() == gc_enabled
+    assert "ase.io.vasp" in sys.modules
+
+    environment = app.jinja_env
+    names = get_template_names(app)
+    assert "visualizer_select_lite.html" in names
+    for name in names:
+        source, filename, _ = environment.loader.get_source(environment, name)
+        bucket = environment.bytecode_cache.get_bucket(
+            environment, name, filename, source
+        )
+        assert bucket.code is not None, name
@@ -0,0 +1,59 @@
+"""Tests for the Link preload headers of the index page (preload.py)."""
+import flask
+
+# pylint: disable=import-error
+import preload
+
+PAGE = """<html><head>
+<link href="static/css/a.css" rel="stylesheet">
+<!--[if lt IE 9]><script src="static/js/old.js"></script><![endif]-->
+<script src="https://example.com/external.js"></script>
+<script src="static/js/b.js"></script>
+<link rel="icon" href="static/img/favicon.ico">
+</head><body>
+<script>var inline = 1;</script>
+<script src="static/js/b.js"></script>
+</body></html>"""
+
+
+def test_get_page_assets():
+    """Only stylesheets and scripts from the app are preloaded, once."""
+    assert preload.get_page_assets(PAGE) == [
+        ("static/css/a.css", "style"),
+        ("static/js/b.js", "script"),
+    ]
+
+
+def test_preload_headers():
+    """The header depends on the template used for the style of the request."""
+    app = flask.Flask(__name__)
+
+    def get_template(request):
+        return request.headers.get("X-App-Style") or "full"
+
+    @app.route("/")
+    def input_data():
+        if get_template(flask.request) == "lite":
+            return '<link rel="stylesheet" href="static/css/lite.css">'
+        return PAGE
+
+    preload.init_app(app, get_template)
+    client = app.test_client()
+    assert client.get("/", headers={"X-App-Style": "lite"}).headers["Link"] == (
+        "<static/css/lite.css>; rel=preload; as=style"
+    )
+    assert client.get("/").headers["Link"] == (
+        "<static/css/a.css>; rel=preload; as=style, "
+        "<static/js/b.js>; rel=preload; as=script"
+    )
+
+
+def test_app_templates_not_loaded_at_startup(app_factory):
+    """Creating the app does not create its Jinja environment, so that it
+    can still be configured, e.g. to reload the templates in development."""
+    app = app_factory.create_app()
+    app.config["TEMPLATES_AUTO_RELOAD"] = True
+    assert app.jinja_env.auto_reload
+
+    response = app.test_client().get("/", headers={"X-App-Style": "lite"})
+    assert "rel=preload; as=style" in response.headers["Link"]
@@ -0,0 +1,92 @@
+"""Stress test running many concurrent requests against the app in threads.
+
+Outside the docker container, the Materials Cloud header files are replaced
+by stubs (see conftest.py).
+"""
+import concurrent.futures
+import copy
+import io
+import os
+import random
+
+import pytest
+
+STRUCTURE_EXAMPLES_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    os.pardir,
+    "structure_converters",
+    "structure_examples",
+)
+NUM_THREADS = 16
+NUM_REQUESTS = 400
+
+
+@pytest.fixture(scope="module")
+def app(app_factory):  # pylint: disable=unused-argument
+    """Return the app of run_app.py."""
+    import run_app  # pylint: disable=import-outside-toplevel,import-error
+
+    return run_app.app
+
+
+def get_requests():
+    """Return a list of (description, kwargs for client.open) for the requests."""
+    requests = [
+        ("index-" + style, {"path": "/", "headers": {"X-App-Style": style}})
+        for style in ["lite", "standard", "full"]
+    ]
+    for subfolder in ["valid", "failing"]:
+        top_dir = os.path.join(STRUCTURE_EXAMPLES_PATH, subfolder)
+        for parser_name in sorted(os.listdir(top_dir)):
+            parser_dir = os.path.join(top_dir, parser_name)
+            for filename in sorted(os.listdir(parser_dir)):
+                if filename.startswith("."):
+                    continue
+                # The XYZ format needs the cell in the form data
+                if parser_name == "xyz-ase":
+                    continue
+                with open(os.path.join(parser_dir, filename), "rb") as fhandle:
+                    content = fhandle.read()
+                requests.append(
+                    (
+                        "{}/{}/{}".format(subfolder, parser_name, filename),
+                        {
+                            "path": "/compute/process_structure/",
+                            "method": "POST",
+                            "data": {
+                                "fileformat": parser_name,
+                                "structurefile": content,
+                            },
+                        },
+                    )
+                )
+    return requests
+
+
+def send(app, kwargs):
+    """Send a request with a new client; return the status code and the body."""
+    kwargs = dict(kwargs)
+    if "data" in kwargs:
+        data = dict(kwargs["data"])
+        data["structurefile"] = (io.BytesIO(data["structurefile"]), "structure")
+        kwargs["data"] = data
+    response = app.test_client().open(**kwargs)
+    return response.status_code, response.get_data()
+
+
+def test_concurrent_requests(app):
+    """Requests served concurrently give the same output as when run alone."""
+    import header  # pylint: disable=import-error,import-outside-toplevel
+
+    header_template_vars = copy.deepcopy(header.template_vars)
+    requests = get_requests()
+    expected = {description: send(app, kwargs) for description, kwargs in requests}
+
+    schedule = random.Random(0).choices(requests, k=NUM_REQUESTS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+        results = executor.map(lambda request: send(app, request[1]), schedule)
+        for (description, _), result in zip(schedule, results):
+            assert result == expected[description], description
+
+    # The shared header variables were not modified by the requests
+    assert header.template_vars == header_template_vars
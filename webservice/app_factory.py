@@ -0,0 +1,377 @@
+"""
+Create the Flask app of a tool, and serve several tools from one process.
+
+`create_app` builds the app of a single tool: run_app.py uses it with the
+default settings (config.yaml in the static folder, the `compute`
+blueprint). To serve several tools in the same process, sharing the
+scientific libraries loaded in memory, describe them in a YAML file:
+
+    tools:
+      - url_prefix: /seekpath
+        compute_module: seekpath_compute    # must define `blueprint`
+        config_file: seekpath/config.yaml
+        template_folder: seekpath/templates  # with a user_templates folder
+        user_static_folder: seekpath/user_static
+      - url_prefix: /phonon-tool
+        ...
+
+(relative paths are relative to the YAML file) and use as WSGI application:
+
+    from app_factory import create_multi_tool_app
+    application = create_multi_tool_app("/home/app/tools.yaml")
+"""
+import datetime
+import importlib
+import io
+import json
+import logging
+import logging.handlers
+import os
+import traceback
+
+import flask
+import jinja2
+import yaml
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import redirect
+
+from web_module import (
+    static_bp,
+    user_static_bp,
+    get_secret_key,
+    get_profiling_key,
+    get_config,
+    configure_templates,
+)
+from tools_barebone import get_style_version, ReverseProxied
+from tools_barebone.admission import AdmissionController
+from tools_barebone.jobs import JobQueue
+from tools_barebone.neighbors import (
+    find_duplicate_atoms,
+    get_bonds,
+    merge_duplicate_atoms,
+)
+from tools_barebone.profiling import RequestProfiler
+from tools_barebone.structure_importers import (
+    get_structure_tuple_with_fallback,
+    UnknownFormatError,
+)
+from conf import (
+    directory,
+    static_folder as default_static_folder,
+    user_static_folder as default_user_static_folder,
+    state_folder as default_state_folder,
+    config_file_path,
+)
+import bundles
+import header
+import preload
+
+# Bonds are not shown for larger structures, to keep the page small
+MAX_ATOMS_FOR_BONDS = 10000
+
+
+def configure_logger():
+    """Add the handler writing the request logs to the 'tools-app' logger,
+    unless it was already added (e.g. by the app of another tool)."""
+    logger = logging.getLogger("tools-app")
+    if logger.handlers:
+        return
+    log_handler = logging.handlers.TimedRotatingFileHandler(
+        os.path.join(directory, "logs", "requests.log"),
+        when="midnight",
+        backupCount=14,
+    )
+    formatter = logging.Formatter(
+        "[%(asctime)s]%(levelname)s-%(funcName)s ^ %(message)s"
+    )
+    log_handler.setFormatter(formatter)
+    logger.addHandler(log_handler)
+    logger.setLevel(logging.DEBUG)
+
+
+def get_visualizer_select_template(request):
+    if get_style_version(request) == "lite":
+        return "visualizer_select_lite.html"
+    if get_style_version(request) == "standard":
+        return "visualizer_select.html"
+    return "visualizer_select_full.html"
+
+
+def input_data():
+    """
+    Main view, input data selection and upload
+    """
+    template = get_visualizer_select_template(flask.request)
+    if template == "visualizer_select_full.html":
+        # Copy the header variables rather than modifying them in place,
+        # as they are shared by all threads serving requests
+        tvars = dict(header.template_vars)
+        tvars["css_classes"] = dict(
+            header.template_vars["css_classes"], archive="", work="active"
+        )
+        return flask.render_template(template, **get_config(), **tvars)
+    return flask.render_template(template, **get_config())
+
+
+def get_default_compute_blueprint(exception_traceback):
+    """Return the blueprint used when there is no compute submodule.
+
+    :param exception_traceback: the traceback of the failed import of the
+        compute submodule, shown to the developer
+    """
+    blueprint = flask.Blueprint("compute", __name__, url_prefix="/compute")
+
+    @blueprint.route("/process_structure/", methods=["GET", "POST"])
+    def process_structure():
+        """Template view, should be replaced when extending tools-barebone."""
+        if flask.request.method == "POST":
+            # check if the post request has the file part
+            if "structurefile" not in flask.request.files:
+                return flask.redirect(flask.url_for("input_data"))
+            structurefile = flask.request.files["structurefile"]
+            fileformat = flask.request.form.get("fileformat", "unknown")
+            filecontent = structurefile.read().decode("utf-8")
+            fileobject = io.StringIO(str(filecontent))
+            form_data = dict(flask.request.form)
+            try:
+                structure_tuple, parser_format = get_structure_tuple_with_fallback(
+                    fileobject, fileformat, extra_data=form_data
+                )
+            except UnknownFormatError:
+                flask.flash("Unknown format '{}'".format(fileformat))
+                return flask.redirect(flask.url_for("input_data"))
+            except Exception:
+                flask.flash(
+                    "I tried my best, but I wasn't able to load your "
+                    "file in format '{}'...".format(fileformat)
+                )
+                return flask.redirect(flask.url_for("input_data"))
+            num_merged_atoms = 0
+            bonds = None
+            try:
+                duplicate_atoms = find_duplicate_atoms(structure_tuple)
+                if duplicate_atoms and get_config()["config"].get(
+                    "merge_duplicate_atoms", False
+                ):
+                    num_atoms = len(structure_tuple[2])
+                    structure_tuple = merge_duplicate_atoms(structure_tuple)
+                    num_merged_atoms = num_atoms - len(structure_tuple[2])
+                    # Only overlapping atoms of different elements are left
+                    duplicate_atoms = find_duplicate_atoms(structure_tuple)
+                if len(structure_tuple[2]) <= MAX_ATOMS_FOR_BONDS:
+                    bonds = get_bonds(structure_tuple)
+            except ValueError:
+                # e.g. the cell is singular (a PDB file without cell), or
+                # too small for the search to be affordable
+                duplicate_atoms = []
+            data_for_template = {
+                "structure_json": json.dumps(
+                    {
+                        "cell": structure_tuple[0],
+                        "atoms": structure_tuple[1],
+                        "numbers": structure_tuple[2],
+                    },
+                    indent=2,
+                    sort_keys=True,
+                ),
+                "exception_traceback": exception_traceback,
+                "parser_format": parser_format,
+                "duplicate_atoms": duplicate_atoms,
+                "num_merged_atoms": num_merged_atoms,
+                "bonds_json": json.dumps(bonds),
+                "bonds_computed": bonds is not None,
+                "max_atoms_for_bonds": MAX_ATOMS_FOR_BONDS,
+            }
+            return flask.render_template("tools_barebone.html", **data_for_template)
+
+        # GET request
+        flask.flash(
+            "This is tools-barebone. You need to define a blueprint in a compute submodule. Import error traceback:\n{}".format(
+                exception_traceback
+            )
+        )
+        return flask.redirect(flask.url_for("input_data"))
+
+    return blueprint
+
+
+def import_compute_blueprint(module_name=None):
+    """Return the `blueprint` of the compute module of a tool.
+
+    :param module_name: the name of the module; if None, the `compute`
+        module is used, or the default blueprint if it cannot be imported
+    :raise ImportError: if the module was named explicitly and cannot be
+        imported
+    """
+    if module_name is not None:
+        return importlib.import_module(module_name).blueprint
+    try:
+        return importlib.import_module("compute").blueprint
+    except ImportError:
+        return get_default_compute_blueprint(traceback.format_exc())
+
+
+def create_app(  # pylint: disable=too-many-arguments
+    config_path=config_file_path,
+    compute_blueprint=None,
+    url_prefix="",
+    template_folder=None,
+    static_folder=default_static_folder,
+    user_static_folder=default_user_static_folder,
+    state_folder=default_state_folder,
+    reverse_proxied=True,
+):
+    """Create the app of a tool.
+
+    :param config_path: the config.yaml file of the tool
+    :param compute_blueprint: the blueprint with the views of the tool;
+        by default, the one of the `compute` module
+    :param url_prefix: the path where the tool is mounted by
+        `create_dispatcher` (empty for a tool served alone)
+    :param template_folder: a folder with the templates of the tool (e.g.
+        with its `user_templates` folder), looked up before the templates
+        of tools-barebone
+    :param static_folder: the folder with the static files of tools-barebone
+    :param user_static_folder: the folder with the static files of the tool
+    :param state_folder: the folder for the files shared among processes
+        (rate limits, background jobs)
+    :param reverse_proxied: if True, wrap the app in `ReverseProxied`
+        (`create_dispatcher` does it once for all tools instead)
+    """
+    configure_logger()
+
+    app = flask.Flask(__name__, root_path=directory, static_folder=static_folder)
+    app.use_x_sendfile = True
+    if reverse_proxied:
+        app.wsgi_app = ReverseProxied(app.wsgi_app)
+    app.secret_key = get_secret_key()
+    # When sending static files, set the max-age to 10 seconds only (for longer, a request will be done to check the actual
+    # file timestamp, and decide whether to reload based on that)
+    app.send_file_max_age_default = datetime.timedelta(seconds=10)
+    app.config.update(
+        TOOLS_CONFIG_FILE=config_path,
+        TOOLS_URL_PREFIX=url_prefix,
+        TOOLS_STATIC_FOLDER=static_folder,
+        TOOLS_USER_STATIC_FOLDER=user_static_folder,
+    )
+    if url_prefix:
+        # Tools on the same host must not overwrite each other's session
+        # (e.g. the flashed messages)
+        app.config["SESSION_COOKIE_NAME"] = "session-" + url_prefix.strip("/").replace(
+            "/", "-"
+        )
+    if template_folder is not None:
+        app.jinja_options = dict(
+            app.jinja_options,
+            loader=jinja2.ChoiceLoader(
+                [
+                    jinja2.FileSystemLoader(template_folder),
+                    app.create_global_jinja_loader(),
+                ]
+            ),
+        )
+    configure_templates(app)
+
+    app.add_url_rule("/", view_func=input_data)
+    app.register_blueprint(static_bp)
+    app.register_blueprint(user_static_bp)
+    if compute_blueprint is None:
+        compute_blueprint = import_compute_blueprint()
+    app.register_blueprint(compute_blueprint)
+
+    startup_config = get_config(config_path)["config"]
+
+    # Limit concurrency and request rate of the compute views, if configured
+    admission_config = startup_config.get("admission_control")
+    if admission_config:
+        AdmissionController.from_config(
+            admission_config,
+            default_state_file=os.path.join(state_folder, "admission.sqlite"),
+        ).init_app(app, blueprint_names=(compute_blueprint.name,))
+
+    # Profiling of the next requests, when armed by an admin
+    RequestProfiler(
+        state_file=os.path.join(state_folder, "profiling.json"),
+        output_folder=os.path.join(directory, "logs", "profiles"),
+        key=get_profiling_key(),
+    ).init_app(app)
+
+    # Bundles of the custom CSS and JS files, if enabled
+    bundles.init_app(app, startup_config)
+
+    # Queue for the views that opt in to run their work as background jobs
+    JobQueue.from_config(
+        startup_config.get("jobs", {}),
+        default_state_file=os.path.join(state_folder, "jobs.sqlite"),
+    ).init_app(app)
+
+    # Preload headers for the files of the index page
+    preload.init_app(app, get_visualizer_select_template)
+
+    return app
+
+
+def create_dispatcher(apps):
+    """Return a WSGI application serving each app under its `url_prefix`.
+
+    :param apps: a list of apps created with `create_app(...,
+        reverse_proxied=False)`, each with a different url_prefix
+    """
+    mounts = {}
+    for app in apps:
+        url_prefix = "/" + app.config["TOOLS_URL_PREFIX"].strip("/")
+        if url_prefix == "/" or url_prefix in mounts:
+            raise ValueError(
+                "Each tool needs a different, non-empty url_prefix "
+                "(got '{}')".format(app.config["TOOLS_URL_PREFIX"])
+            )
+        mounts[url_prefix] = app
+
+    def root_app(environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.rstrip("/") in mounts:
+            # The pages use relative links: the tools must be visited at
+            # '<url_prefix>/', not '<url_prefix>'
+            url = environ.get("SCRIPT_NAME", "") + path.rstrip("/") + "/"
+            return redirect(url)(environ, start_response)
+        return NotFound()(environ, start_response)
+
+    return ReverseProxied(DispatcherMiddleware(root_app, mounts))
+
+
+def create_multi_tool_app(tools_file):
+    """Return a WSGI application serving all the tools described in a YAML
+    file (see the docstring of this module)."""
+    with open(tools_file) as fhandle:
+        tools = yaml.safe_load(fhandle)["tools"]
+    base_folder = os.path.dirname(os.path.abspath(tools_file))
+
+    def get_path(tool, key, default):
+        if key not in tool:
+            return default
+        return os.path.join(base_folder, tool[key])
+
+    apps = []
+    for tool in tools:
+        name = tool["url_prefix"].strip("/")
+        apps.append(
+            create_app(
+                config_path=get_path(tool, "config_file", config_file_path),
+                compute_blueprint=import_compute_blueprint(tool.get("compute_module")),
+                url_prefix=tool["url_prefix"],
+                template_folder=get_path(tool, "template_folder", None),
+                static_folder=get_path(tool, "static_folder", default_static_folder),
+                user_static_folder=get_path(
+                    tool, "user_static_folder", default_user_static_folder
+                ),
+                state_folder=get_path(
+                    tool,
+                    "state_folder",
+                    os.path.join(default_state_folder, name.replace("/", "-")),
+                ),
+                reverse_proxied=False,
+            )
+        )
+    return create_dispatcher(apps)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Bundle the custom CSS and JS files declared in the config.yaml file.
+
+Each file in `custom_css_files` and `custom_js_files` is a separate request
+from the browser. If `bundle_assets: true` is set in the config, the files of
+each list are concatenated (in order, with CSS minified) into a single bundle
+named by the hash of its content, and the templates reference the bundle
+instead of the individual files. Bundles are built when the app starts; to
+build them when creating the docker image, run:
+
+    python3 webservice/bundles.py
+
+In debug mode (e.g. running run_app.py directly) the individual files are
+used. In the bundles, each file starts with a comment with its name.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import sys
+
+from conf import static_folder, user_static_folder
+from web_module import get_config
+
+# Subfolders of the static folder where the bundles are written
+BUNDLE_FOLDERS = {
+    "css": os.path.join("css", "bundles"),
+    "js": os.path.join("js", "bundles"),
+}
+
+_CSS_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|\s*([{};,])\s*|(\s+)""",
+    re.DOTALL,
+)
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def minify_css(text):
+    """Remove comments and unneeded whitespace from CSS (strings are kept)."""
+
+    def replace(match):
+        string, comment, punctuation, _ = match.groups()
+        if string:
+            return string
+        if comment:
+            # Keep license comments
+            return comment if comment.startswith("/*!") else ""
+        if punctuation:
+            return punctuation
+        return " "
+
+    return _CSS_TOKENS.sub(replace, text).strip()
+
+
+def rebase_css_urls(text, from_folder, to_folder):
+    """Rewrite the relative url()s of a CSS file moved between two folders
+    of the static folder (both given relative to it, with '/')."""
+
+    def replace(match):
+        url = match.group(2).strip()
+        if re.match(r"^([a-z]+:|/|#)", url, re.IGNORECASE):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(from_folder, url))
+        return "url({})".format(posixpath.relpath(target, to_folder))
+
+    return _CSS_URL.sub(replace, text)
+
+
+def get_css_sources(css_files, static_dir):
+    """Return the (name, path) of the CSS files, or None if any of them
+    cannot be bundled."""
+    sources = []
+    for cfile in css_files:
+        path = os.path.join(static_dir, "css", "custom", cfile)
+        if not os.path.isfile(path):
+            return None
+        sources.append((cfile, path))
+    return sources
+
+
+def get_js_sources(js_files, static_dir, user_static_dir):
+    """Return the (name, path) of the JS files, or None if any of them
+    is not a local static file (e.g. an external URL)."""
+    folders = {"static": static_dir, "user_static": user_static_dir}
+    sources = []
+    for jsfile in js_files:
+        top_folder, _, subpath = jsfile.partition("/")
+        if top_folder not in folders or ".." in subpath.split("/"):
+            return None
+        path = os.path.join(folders[top_folder], *subpath.split("/"))
+        if not os.path.isfile(path):
+            return None
+        sources.append((jsfile, path))
+    return sources
+
+
+def write_bundle(kind, sources, static_dir):
+    """Concatenate the sources into a bundle; return its file name."""
+    parts = []
+    for name, path in sources:
+        with open(path, encoding="utf-8") as fhandle:
+            text = fhandle.read()
+        if kind == "css":
+            text = minify_css(
+                rebase_css_urls(
+                    text,
+                    posixpath.dirname(posixpath.join("css", "custom", name)),
+                    "css/bundles",
+                )
+            )
+        else:
+            # Avoid joining the last statement of a file with the next file
+            text = text.rstrip() + "\n;"
+        parts.append("/* {} */\n{}\n".format(name.replace("*/", ""), text))
+    content = "".join(parts).encode("utf-8")
+
+    filename = "bundle-{}.{}".format(hashlib.sha256(content).hexdigest()[:16], kind)
+    folder = os.path.join(static_dir, BUNDLE_FOLDERS[kind])
+    path = os.path.join(folder, filename)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        # Write and rename: other processes may be writing the same bundle
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as fhandle:
+            fhandle.write(content)
+        os.replace(tmp_path, path)
+    return filename
+
+
+def build_bundles(config, static_dir=static_folder, user_static_dir=user_static_folder):
+    """Build the bundles of all the lists of custom files in the config.
+
+    :return: a dictionary mapping (kind, tuple of files) to the file name
+        of the bundle, for kind in 'css', 'js'
+    """
+    bundles = {}
+    for kind, config_key in [("css", "custom_css_files"), ("js", "custom_js_files")]:
+        for files in config[config_key].values():
+            files = tuple(files or ())
+            if not files or (kind, files) in bundles:
+                continue
+            if kind == "css":
+                sources = get_css_sources(files, static_dir)
+            else:
+                sources = get_js_sources(files, static_dir, user_static_dir)
+            if sources is not None:
+                bundles[(kind, files)] = write_bundle(kind, sources, static_dir)
+    return bundles
+
+
+def init_app(app, config):
+    """Build the bundles if enabled in the config, and make the
+    `get_asset_bundle(kind, files)` function available to the templates.
+
+    `get_asset_bundle` returns the URL of the bundle of the given list of
+    files, relative to the page of the app root, or None if the files must
+    be included one by one.
+    """
+    bundles = {}
+    if config.get("bundle_assets", False):
+        try:
+            bundles = build_bundles(
+                config,
+                app.config.get("TOOLS_STATIC_FOLDER", static_folder),
+                app.config.get("TOOLS_USER_STATIC_FOLDER", user_static_folder),
+            )
+        except OSError as exc:
+            app.logger.warning("Could not build the asset bundles: %s", exc)
+
+    def get_asset_bundle(kind, files):
+        if app.debug:
+            return None
+        filename = bundles.get((kind, tuple(files or ())))
+        if filename is None:
+            return None
+        return "static/{}/bundles/{}".format(kind, filename)
+
+    @app.context_processor
+    def asset_bundles_context():
+        return {"get_asset_bundle": get_asset_bundle}
+
+
+def main():
+    config = get_config()["config"]
+    bundles = build_bundles(config)
+    for (kind, files), filename in sorted(bundles.items()):
+        print("{}: {} -> {}".format(kind, ", ".join(files), filename))
+    if not config.get("bundle_assets", False):
+        print(
+            "WARNING: set 'bundle_assets: true' in the config to use the bundles",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
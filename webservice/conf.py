@@ -15,4 +15,7 @@ directory = os.path.split(os.path.realpath(__file__))[0]
 static_folder = os.path.join(directory, "static")
 user_static_folder = os.path.join(directory, "user_static")
 view_folder = os.path.join(directory, "view")
+# Files shared among the processes of the app (rate limits, ...)
+state_folder = os.path.join(directory, "state")
+jinja_cache_folder = os.path.join(state_folder, "jinja_cache")
 config_file_path = os.path.join(static_folder, "config.yaml")
@@ -0,0 +1,34 @@
+"""
+Configuration to serve run_app.app with gunicorn, preloading the app in the
+master process so that its memory is shared among the workers:
+
+    gunicorn -c webservice/gunicorn.conf.py --bind 0.0.0.0:8000
+
+gunicorn executes this file in the master process before loading the app
+(with `preload_app`, the app is loaded before the `on_starting` hook is
+called): the GC is disabled and the app is preloaded here, and re-enabled
+in each worker by the `post_fork` hook. See the "Pre-fork preload mode"
+section of README_DEPLOY.md.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+# pylint: disable=invalid-name,wrong-import-position,import-error
+from prefork_server import enable_gc_in_worker, preload_and_freeze
+
+# Import the app, the parsers and the templates, and freeze the GC; gunicorn
+# then finds run_app already imported
+preload_and_freeze()
+
+wsgi_app = "run_app:app"
+preload_app = True
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+# Workers stuck for longer than this are killed and restarted
+timeout = 120
+graceful_timeout = 30
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    enable_gc_in_worker()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Precompile all the Jinja templates of the app into the bytecode cache.
+
+Run this when building the docker image (after all templates, including
+the user templates and the Materials Cloud header, have been copied), so
+that worker processes do not need to compile templates on their first
+request:
+
+    python3 webservice/precompile_templates.py
+
+With `--measure`, report the time needed to load all templates from
+scratch with an empty cache and with the populated one (this is what
+every new worker process pays on its first requests).
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+import flask
+
+from conf import directory, jinja_cache_folder
+from web_module import configure_templates, get_config
+
+
+def get_app(cache_folder=jinja_cache_folder):
+    """Return a Flask app with the same Jinja environment as run_app.app."""
+    app = flask.Flask("run_app", root_path=directory)
+    configure_templates(app, cache_folder=cache_folder)
+    return app
+
+
+def get_template_names(app):
+    """Return the names of all templates of the app.
+
+    Also warn for templates referenced in the config.yaml that do not exist.
+    """
+    names = [name for name in app.jinja_env.list_templates() if name.endswith(".html")]
+    include_pages = get_config()["include_pages"]
+    referenced = [
+        entry["template_page"]
+        for entry in include_pages.pop("additional_accordion_entries")
+    ] + [name for name in include_pages.values() if name is not None]
+    for name in referenced:
+        if name not in names:
+            print(
+                "WARNING: template '{}' referenced in the config not found".format(
+                    name
+                ),
+                file=sys.stderr,
+            )
+    return names
+
+
+def load_all_templates(app, names):
+    """Load (and compile, if not cached) all templates; return the time spent."""
+    start = time.perf_counter()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return time.perf_counter() - start
+
+
+def measure(names):
+    """Print the time to load all templates without and with the cache."""
+    cache_folder = tempfile.mkdtemp()
+    try:
+        cold = load_all_templates(get_app(cache_folder), names)
+        warm = load_all_templates(get_app(cache_folder), names)
+    finally:
+        shutil.rmtree(cache_folder)
+    print(
+        "Loading {} templates: {:.1f} ms without cache, {:.1f} ms with cache".format(
+            len(names), cold * 1000, warm * 1000
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--measure",
+        action="store_true",
+        help="Also measure the template loading time with and without cache",
+    )
+    args = parser.parse_args()
+
+    app = get_app()
+    names = get_template_names(app)
+    if args.measure:
+        measure(names)
+    load_all_templates(app, names)
+    print("Precompiled {} templates into {}".format(len(names), jinja_cache_folder))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Measure the memory shared by pre-forked workers with a preloaded app.
+
+The master process imports the app (which loads the config), all the
+backends of the structure importers, and compiles all the templates. Then,
+it calls gc.freeze() and forks the workers: as the garbage collector will not
+touch the objects created so far, the memory pages holding them (e.g. the
+large heaps of pymatgen and ASE) remain shared copy-on-write among the
+workers instead of being duplicated in each of them.
+
+In production, use gunicorn with gunicorn.conf.py, which calls the
+functions of this module (see README_DEPLOY.md). This script serves the app with the
+development server of werkzeug (without worker timeouts or graceful
+reloads): only use it to measure the effect of the preloading, e.g.
+
+    python webservice/prefork_server.py --bind 127.0.0.1:8000 --workers 4
+
+and then admin-tools/measure-worker-memory.py to check the unique and shared
+memory of each worker (compare with `--no-freeze`).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+from werkzeug.serving import make_server
+
+
+def preload_and_freeze(freeze=True):
+    """Import the app and everything it needs, and freeze the GC.
+
+    Call this early in the master process, before anything imports the
+    app or the scientific libraries: as recommended in the documentation
+    of gc.freeze(), the GC is disabled from here on, so that collections
+    do not leave freed holes in the memory pages that will be shared.
+    Call `enable_gc_in_worker` early in each worker after the fork.
+
+    :param freeze: if False, do not disable and freeze the GC (e.g. to
+        measure the difference)
+    :return: the app
+    """
+    if freeze:
+        gc.disable()
+    # pylint: disable=import-outside-toplevel
+    from tools_barebone.structure_importers import preload_backends
+    from run_app import app
+    from precompile_templates import get_template_names, load_all_templates
+
+    preload_backends()
+    load_all_templates(app, get_template_names(app))
+    # Collect garbage now, so that the freed memory is not shared (and
+    # later written to) by the workers, then freeze all remaining objects
+    gc.collect()
+    if freeze:
+        gc.freeze()
+    return app
+
+
+def enable_gc_in_worker():
+    """Re-enable the GC, disabled by `preload_and_freeze`, in a worker."""
+    gc.enable()
+
+
+def serve_worker(app, listening_socket, threaded):
+    """Serve requests from the shared listening socket, forever."""
+    host, port = listening_socket.getsockname()[:2]
+    server = make_server(
+        host, port, app, threaded=threaded, fd=listening_socket.fileno()
+    )
+    server.serve_forever()
+
+
+def start_worker(app, listening_socket, threaded):
+    """Fork a worker process; return its PID."""
+    pid = os.fork()
+    if pid == 0:
+        enable_gc_in_worker()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            serve_worker(app, listening_socket, threaded)
+        finally:
+            os._exit(1)  # pylint: disable=protected-access
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        epilog="For production, use gunicorn with gunicorn.conf.py instead.",
+    )
+    parser.add_argument(
+        "--bind", default="127.0.0.1:8000", help="host:port (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--threaded",
+        action="store_true",
+        help="Serve each request in a new thread within the worker",
+    )
+    parser.add_argument(
+        "--no-freeze",
+        action="store_true",
+        help="Do not call gc.freeze() before forking (to compare memory usage)",
+    )
+    args = parser.parse_args()
+
+    host, _, port = args.bind.rpartition(":")
+    app = preload_and_freeze(freeze=not args.no_freeze)
+    app.use_x_sendfile = False
+
+    listening_socket = socket.create_server((host, int(port)), backlog=128)
+    listening_socket.set_inheritable(True)
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        workers.add(start_worker(app, listening_socket, args.threaded))
+    print(
+        "Master {} serving on http://{} with workers {}".format(
+            os.getpid(), args.bind, " ".join(str(pid) for pid in sorted(workers))
+        ),
+        file=sys.stderr,
+    )
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print("Worker {} died, restarting it".format(pid), file=sys.stderr)
+            workers.add(start_worker(app, listening_socket, args.threaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Add `Link: <...>; rel=preload` headers to the index page.
+
+The browser only finds the CSS and JS files of the index page after it has
+downloaded and parsed the HTML. With `Link` preload headers, it can start
+downloading them as soon as it receives the headers of the response, and
+servers and CDNs supporting Early Hints can even send them in a
+`103 Early Hints` response before the page is generated.
+
+The list of files is derived on the first request to the index page, by
+rendering the page for each style variant (see `get_style_version`) and collecting the
+stylesheets and scripts it loads from the app (including the custom CSS
+and JS files declared in the config, or their bundles).
+
+Run this file to print the headers of each style variant, and the
+directives to send them as Early Hints with Apache's mod_http2:
+
+    python3 webservice/preload.py
+"""
+import html.parser
+import posixpath
+import re
+import threading
+
+import flask
+
+# Representative values of the X-App-Style header
+STYLE_VERSIONS = ["lite", "standard", ""]
+
+
+class _AssetsParser(html.parser.HTMLParser):
+    """Collect the stylesheets and scripts of a page (in order, skipping
+    the ones in comments, e.g. for old browsers)."""
+
+    def __init__(self):
+        super().__init__()
+        self.assets = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "link" and "stylesheet" in (attrs.get("rel") or "").split():
+            self._add(attrs.get("href"), "style")
+        elif tag == "script":
+            self._add(attrs.get("src"), "script")
+
+    def _add(self, url, kind):
+        # Only files from the app: external ones would need crossorigin
+        if url and not re.match(r"^([a-z][a-z0-9+.-]*:|//)", url, re.IGNORECASE):
+            if (url, kind) not in self.assets:
+                self.assets.append((url, kind))
+
+
+def get_page_assets(page):
+    """Return the (url, kind) of the stylesheets and scripts of an HTML page,
+    with kind being 'style' or 'script'."""
+    parser = _AssetsParser()
+    parser.feed(page)
+    parser.close()
+    return parser.assets
+
+
+def format_link_header(assets):
+    """Return the value of the Link header to preload the assets."""
+    return ", ".join(
+        "<{}>; rel=preload; as={}".format(url, kind) for url, kind in assets
+    )
+
+
+def get_preload_assets(app, get_template, endpoint="input_data"):
+    """Render the page of the endpoint for each style variant.
+
+    :param app: the Flask app
+    :param get_template: the function returning the name of the template
+        used for a request (see `app_factory.get_visualizer_select_template`)
+    :param endpoint: the endpoint of the page
+    :return: a dictionary mapping each template to the list of its assets
+    """
+    assets = {}
+    for style in STYLE_VERSIONS:
+        with app.test_request_context("/", headers={"X-App-Style": style}):
+            template = get_template(flask.request)
+            if template in assets:
+                continue
+            try:
+                page = app.view_functions[endpoint]()
+            except Exception as exc:  # pylint: disable=broad-except
+                app.logger.warning(
+                    "Cannot find the assets to preload for %s: %s", template, exc
+                )
+                continue
+            assets[template] = get_page_assets(page)
+    return assets
+
+
+def init_app(app, get_template, endpoint="input_data"):
+    """Add the Link preload headers to the responses of the endpoint.
+
+    The assets are found on the first response of the endpoint, rather
+    than here: rendering a page creates the Jinja environment of the app,
+    which must not happen before the app is configured (e.g. with
+    TEMPLATES_AUTO_RELOAD by run_app.py). In debug mode, no header is
+    added (the templates may change while the app runs).
+    """
+    link_headers = {}
+    lock = threading.Lock()
+
+    def get_link_headers():
+        with lock:
+            if "headers" not in link_headers:
+                link_headers["headers"] = {
+                    template: format_link_header(assets)
+                    for template, assets in get_preload_assets(
+                        app, get_template, endpoint
+                    ).items()
+                    if assets
+                }
+        return link_headers["headers"]
+
+    @app.after_request
+    def add_preload_headers(response):
+        if (
+            flask.request.endpoint == endpoint
+            and response.status_code == 200
+            and not app.debug
+        ):
+            link_header = get_link_headers().get(get_template(flask.request))
+            if link_header:
+                response.headers.add("Link", link_header)
+        return response
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from app_factory import create_app, get_visualizer_select_template
+
+    app = create_app()
+    assets = get_preload_assets(app, get_visualizer_select_template)
+    for template, template_assets in assets.items():
+        print("{}:\n  Link: {}\n".format(template, format_link_header(template_assets)))
+
+    common = [
+        asset
+        for asset in next(iter(assets.values()), [])
+        if all(asset in template_assets for template_assets in assets.values())
+    ]
+    print("Apache (mod_http2) directives to send the files used by all styles")
+    print("as 103 Early Hints, in the Location of the index page (the paths")
+    print("assume that the tool is served at /; add its prefix otherwise):")
+    print("  H2EarlyHints on")
+    for url, _ in common:
+        print("  H2PushResource add {}".format(posixpath.normpath("/" + url)))
+
+
+if __name__ == "__main__":
+    main()
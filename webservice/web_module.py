@@ -8,12 +8,14 @@ from collections import OrderedDict
 import yaml
 import flask
 from flask import Blueprint
+from jinja2 import FileSystemBytecodeCache
 
 from conf import (
     directory,
     static_folder,
     user_static_folder,
     config_file_path,
+    jinja_cache_folder,
     ConfigurationError,
 )
 
@@ -28,6 +30,7 @@ upload_structure_block_known_formats = OrderedDict(
         "xyz-ase": "XYZ File (.xyz) [parser: ase]",
         "cif-ase": "CIF File (.cif) [parser: ase]",
         "cif-pymatgen": "CIF File (.cif) [parser: pymatgen]",
+        "cif-auto": "CIF File (.cif) [parser: automatic]",
     }
 )
 
@@ -46,6 +49,22 @@ def get_secret_key():
         )
 
 
+def get_profiling_key():
+    """Return the key to arm the profiling of requests via HTTP, from the
+    PROFILING_KEY file, or None if the file does not exist."""
+    path = os.path.join(directory, "PROFILING_KEY")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        profiling_key = f.read().strip()
+    if len(profiling_key) < 16:
+        raise ConfigurationError(
+            "The PROFILING_KEY file in {} must contain a random string "
+            "of at least 16 characters".format(directory)
+        )
+    return profiling_key
+
+
 def parse_config(config):
     default_templates_folder = "default_templates"
     user_templates_folder = "user_templates"
@@ -114,9 +133,24 @@ def set_config_defaults(config):
     return new_config
 
 
-def get_config():
+def get_app_setting(key, default):
+    """Return a setting of the current app (see `app_factory.create_app`),
+    or `default` outside of an app context or if it is not set."""
+    if flask.has_app_context():
+        return flask.current_app.config.get(key, default)
+    return default
+
+
+def get_config(config_path=None):
+    """Return the variables for the templates, from the config.yaml file.
+
+    :param config_path: the config.yaml file to read; by default, the one
+        of the current app, or the one in the static folder
+    """
+    if config_path is None:
+        config_path = get_app_setting("TOOLS_CONFIG_FILE", config_file_path)
     try:
-        with open(config_file_path) as config_file:
+        with open(config_path) as config_file:
             config = yaml.safe_load(config_file)
     except IOError as exc:
         if exc.errno == 2:  # No such file or directory
@@ -134,6 +168,49 @@ def get_config():
     }
 
 
+def configure_templates(app, cache_folder=jinja_cache_folder):
+    """Configure the Jinja environment of the app for production.
+
+    Compiled templates are cached on disk (and can be precompiled when
+    building the docker image, see precompile_templates.py), so that new
+    worker processes do not need to compile them again. Templates are
+    not checked for changes on disk (set TEMPLATES_AUTO_RELOAD to True
+    in the app config to develop).
+
+    Must be called before the Jinja environment is first used.
+
+    :param app: the Flask app
+    :param cache_folder: the folder where compiled templates are stored
+    """
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+    except OSError:
+        # Not writable: templates will just be compiled in each process
+        pass
+    else:
+        app.jinja_options = dict(
+            app.jinja_options,
+            bytecode_cache=FileSystemBytecodeCache(cache_folder),
+        )
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+
+
+def get_static_folder():
+    return get_app_setting("TOOLS_STATIC_FOLDER", static_folder)
+
+
+def get_user_static_folder():
+    return get_app_setting("TOOLS_USER_STATIC_FOLDER", user_static_folder)
+
+
+def send_static_file(folder, path):
+    """Send a file; bundles (see bundles.py) are named by their content
+    hash, so they can be cached by the browser forever."""
+    if path.startswith("bundles/"):
+        return flask.send_from_directory(folder, path, max_age=365 * 24 * 3600)
+    return flask.send_from_directory(folder, path)
+
+
 static_bp = Blueprint("static", __name__, url_prefix="/static")
 user_static_bp = Blueprint("user_static", __name__, url_prefix="/user_static")
 
@@ -143,7 +220,7 @@ def send_js(path):
     """
     Serve static JS files
     """
-    return flask.send_from_directory(os.path.join(static_folder, "js"), path)
+    return send_static_file(os.path.join(get_static_folder(), "js"), path)
 
 
 @user_static_bp.route("/js/<path:path>")
@@ -151,7 +228,7 @@ def send_custom_js(path):
     """
     Serve static JS files
     """
-    return flask.send_from_directory(os.path.join(user_static_folder, "js"), path)
+    return flask.send_from_directory(os.path.join(get_user_static_folder(), "js"), path)
 
 
 @static_bp.route("/img/<path:path>")
@@ -159,7 +236,7 @@ def send_img(path):
     """
     Serve static image files
     """
-    return flask.send_from_directory(os.path.join(static_folder, "img"), path)
+    return flask.send_from_directory(os.path.join(get_static_folder(), "img"), path)
 
 
 @user_static_bp.route("/img/<path:path>")
@@ -167,7 +244,9 @@ def send_custom_img(path):
     """
     Serve static image files
     """
-    return flask.send_from_directory(os.path.join(user_static_folder, "img"), path)
+    return flask.send_from_directory(
+        os.path.join(get_user_static_folder(), "img"), path
+    )
 
 
 @static_bp.route("/css/<path:path>")
@@ -175,7 +254,7 @@ def send_css(path):
     """
     Serve static CSS files
     """
-    return flask.send_from_directory(os.path.join(static_folder, "css"), path)
+    return send_static_file(os.path.join(get_static_folder(), "css"), path)
 
 
 @user_static_bp.route("/css/<path:path>")
@@ -183,7 +262,9 @@ def send_custom_css(path):
     """
     Serve static CSS files
     """
-    return flask.send_from_directory(os.path.join(user_static_folder, "css"), path)
+    return flask.send_from_directory(
+        os.path.join(get_user_static_folder(), "css"), path
+    )
 
 
 @user_static_bp.route("/data/<path:path>")
@@ -191,7 +272,9 @@ def send_custom_data(path):
     """
     Serve static font files
     """
-    return flask.send_from_directory(os.path.join(user_static_folder, "data"), path)
+    return flask.send_from_directory(
+        os.path.join(get_user_static_folder(), "data"), path
+    )
 
 
 @static_bp.route("/css/images/<path:path>")
@@ -199,7 +282,9 @@ def send_cssimages(path):
     """
     Serve static CSS images files
     """
-    return flask.send_from_directory(os.path.join(static_folder, "css", "images"), path)
+    return flask.send_from_directory(
+        os.path.join(get_static_folder(), "css", "images"), path
+    )
 
 
 @user_static_bp.route("/css/images/<path:path>")
@@ -208,7 +293,7 @@ def send_custom_cssimages(path):
     Serve static CSS images files
     """
     return flask.send_from_directory(
-        os.path.join(user_static_folder, "css", "images"), path
+        os.path.join(get_user_static_folder(), "css", "images"), path
     )
 
 
@@ -217,7 +302,7 @@ def send_fonts(path):
     """
     Serve static font files
     """
-    return flask.send_from_directory(os.path.join(static_folder, "fonts"), path)
+    return flask.send_from_directory(os.path.join(get_static_folder(), "fonts"), path)
 
 
 @user_static_bp.route("/fonts/<path:path>")
@@ -225,4 +310,6 @@ def send_custom_fonts(path):
     """
     Serve static font files
     """
-    return flask.send_from_directory(os.path.join(user_static_folder, "fonts"), path)
+    return flask.send_from_directory(
+        os.path.join(get_user_static_folder(), "fonts"), path
+    )